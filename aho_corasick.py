@@ -0,0 +1,90 @@
+from collections import deque
+
+
+class Automaton:
+    """Aho-Corasick多模式匹配自动机，一次扫描文本找出所有模式串的出现位置
+
+    Args:
+        patterns (list[str]): 模式串，重复的模式串只保留一份，空串会被忽略
+    """
+
+    def __init__(self, patterns):
+        self.patterns = []
+        self._pattern_ids = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern in patterns:
+            if pattern and pattern not in self._pattern_ids:
+                self._pattern_ids[pattern] = len(self.patterns)
+                self.patterns.append(pattern)
+                self._insert(pattern)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(self._pattern_ids[pattern])
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # 合并后缀状态的输出，匹配时不用再沿失败链查找
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def pattern_id(self, pattern: str):
+        return self._pattern_ids.get(pattern)
+
+    def iter_matches(self, text: str):
+        """按结束位置顺序产出所有（可重叠的）匹配
+
+        Args:
+            text (str): 待扫描文本
+
+        Yields:
+            tuple[int, int]: (匹配的起始位置, 模式串编号)
+        """
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                yield end - len(patterns[pattern_id]), pattern_id
+
+    def count(self, text: str) -> list[int]:
+        """统计每个模式串不重叠出现的次数，与str.count的语义一致
+
+        Args:
+            text (str): 待扫描文本
+
+        Returns:
+            list[int]: 按模式串编号排列的出现次数
+        """
+        counts = [0] * len(self.patterns)
+        next_free = [0] * len(self.patterns)
+        lengths = [len(pattern) for pattern in self.patterns]
+        for start, pattern_id in self.iter_matches(text):
+            if start >= next_free[pattern_id]:
+                counts[pattern_id] += 1
+                next_free[pattern_id] = start + lengths[pattern_id]
+        return counts
@@ -1,38 +1,55 @@
 import os
 from flask import Flask, render_template, request, jsonify
-from main import backend_main
+from main import backend_main, domain_docstore, BONUS_MODES
 from bs4 import BeautifulSoup
 from tokenizer import segment_text
+from extract import load_record
+from build import read_generations
+from result_cache import result_cache, cache_key
 
 app = Flask(__name__)
 saved_folder = ""
 
-def get_results_from_folders(folder_list, saved_folder, query):
+def get_results_from_folders(folder_list, saved_folder, query, docstore=None):
     results = []
+    query_words = segment_text(query, "stopwords-master").split("/")
     for folder, url in folder_list:
 
+        # 优先从文档存储读取标题和正文，不为每个结果打开文件
+        stored = docstore.get(folder) if docstore is not None else None
+        if stored is not None:
+            title = stored[0] or "No Title"
+            content_preview = stored[1]
+            results.append(render_result(url, title, content_preview, query_words))
+            continue
+
         index_html_path = os.path.join(folder, "index.html")
-        with open(index_html_path, "r", encoding="utf-8") as f:
-            soup = BeautifulSoup(f, "html.parser")
-            title = soup.title.string if soup.title else "No Title"
+        record = load_record(index_html_path)
+        if record is not None:
+            title = record["title"] or "No Title"
+        else:
+            with open(index_html_path, "r", encoding="utf-8") as f:
+                soup = BeautifulSoup(f, "html.parser")
+                title = soup.title.string if soup.title else "No Title"
 
         index_content_path = os.path.join(folder, "index_content.txt")
         with open(index_content_path, "r", encoding="utf-8") as f:
             content_preview = f.read()
 
-        query_words = segment_text(query, "stopwords-master").split("/")
+        results.append(render_result(url, title, content_preview, query_words))
+    return results
+
 
-        title = highlight_words(title, query_words)
-        highlighted_content = highlight_words(content_preview, query_words)
+def render_result(url, title, content_preview, query_words):
+    title = highlight_words(title, query_words)
+    highlighted_content = highlight_words(content_preview, query_words)
 
-        result = {
-            "url": url,
-            "title": title,
-            # 'folders': folders,
-            "description": highlighted_content,
-        }
-        results.append(result)
-    return results
+    return {
+        "url": url,
+        "title": title,
+        # 'folders': folders,
+        "description": highlighted_content,
+    }
 
 
 def highlight_words(text, words):
@@ -56,8 +73,20 @@ def search():
     data = request.json
     query = data.get('query', '')
     domains = set(data.get('domains', []))
+    bonus_mode = data.get('bonus_mode', 'window')
     saved_folder = "saved"
 
+    # 未知的重排序方式直接拒绝，不进入查询，也不产生缓存键
+    if bonus_mode not in BONUS_MODES:
+        return jsonify({"error": f"Unknown bonus_mode: {bonus_mode}"}), 400
+
+    # cache_key内部规范化query，空白不同的query共用缓存；检索仍使用原始query
+    generations = read_generations(saved_folder, domains)
+    key = cache_key(query, domains, generations, top_k=60, bonus_mode=bonus_mode)
+    results = result_cache.get(key)
+    if results is not None:
+        return jsonify(results)
+
     results = backend_main(
         target_urls=domains,
         target_domains=domains,
@@ -65,11 +94,22 @@ def search():
         stopwords_dir="stopwords-master",
         query=query,
         top_k=60,
+        bonus_mode=bonus_mode,
     )
 
-    results = get_results_from_folders(results, saved_folder, query)
+    docstore = domain_docstore(domains, saved_folder)
+    results = get_results_from_folders(results, saved_folder, query, docstore)
+    # 查询期间版本号变化（第一次查询时构建域名，或者并发的重建、流水线提交）时，
+    # 无法确定结果对应哪个版本，不缓存；之后的查询用构建之后的版本号缓存
+    if read_generations(saved_folder, domains) == generations:
+        result_cache.put(key, results)
     
     return jsonify(results)
 
+
+@app.route("/cache_stats")
+def cache_stats():
+    return jsonify(result_cache.stats())
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=12345, debug=True)
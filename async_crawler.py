@@ -0,0 +1,218 @@
+import os
+import asyncio
+import logging
+import aiohttp
+from urllib.parse import urlparse
+from crawler import HEADERS, page_path, store_page
+from ratelimit import TokenBucket
+from utils import configure_logging
+from frontier import open_crawl_state
+from page_cache import PageCache
+
+
+class HostLimits:
+    """每个host一个并发上限和一个令牌桶
+
+    Args:
+        concurrency (int): 每个host同时进行的请求数
+        rate (float): 每个host每秒的请求数
+    """
+
+    def __init__(self, concurrency: int, rate: float):
+        self.concurrency = concurrency
+        self.rate = rate
+        self._semaphores = {}
+        self._buckets = {}
+
+    def get(self, url: str) -> tuple:
+        host = urlparse(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+            self._buckets[host] = TokenBucket(self.rate, capacity=self.concurrency)
+        return self._semaphores[host], self._buckets[host]
+
+
+async def conditional_fetch(
+    session: aiohttp.ClientSession, url: str, host_limits: HostLimits, validators: dict = None
+) -> tuple:
+    """遵守host的并发与速率限制抓取网页；有上次的ETag/Last-Modified时发送条件请求
+
+    Args:
+        session (aiohttp.ClientSession): 复用keep-alive连接的会话
+        url (str): 目标网页
+        host_limits (HostLimits): host限制
+        validators (dict, optional): PageCache中的记录. Defaults to None.
+
+    Returns:
+        tuple: (状态码, 原始内容, 解码后的文本, 响应头)，304时内容为空，失败时返回None
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    semaphore, bucket = host_limits.get(url)
+    async with semaphore:
+        await asyncio.sleep(bucket.reserve())
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return 304, b"", "", response.headers
+                response.raise_for_status()
+                content = await response.read()
+                html_doc = await response.text(errors="replace")
+                return response.status, content, html_doc, response.headers
+        except aiohttp.ClientResponseError as e:
+            logging.error(f"HTTP error: {e} - URL: {url}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Request error: {e!r} - URL: {url}")
+            return None
+
+
+async def fetch_page_async(
+    session: aiohttp.ClientSession,
+    host_limits: HostLimits,
+    current_url: str,
+    current_depth: int,
+    domain: str,
+    save_path: str,
+    max_depth: int,
+    page_cache: PageCache = None,
+    extract: bool = False,
+) -> tuple:
+    """异步版本的fetch_page，返回值相同"""
+    file_path = page_path(current_url, save_path)
+    validators = page_cache.get(current_url) if page_cache is not None else None
+    if validators is not None and not os.path.exists(file_path):
+        validators = None
+
+    result = await conditional_fetch(session, current_url, host_limits, validators)
+    if result is None:
+        return None, None
+    status, content, html_doc, headers = result
+
+    # 解析和写盘是CPU/IO密集的，放到线程里避免阻塞事件循环
+    links = await asyncio.to_thread(
+        store_page,
+        current_url,
+        file_path,
+        status,
+        content,
+        lambda: html_doc,
+        headers,
+        validators,
+        domain,
+        save_path,
+        page_cache,
+        None,
+        extract,
+    )
+
+    if current_depth < max_depth:
+        return links, current_depth + 1
+
+    return set(), None
+
+
+async def links_scraper_async(
+    url: str,
+    domain: str,
+    save_path: str,
+    max_depth: int = 12,
+    concurrency: int = 200,
+    per_host_concurrency: int = 8,
+    per_host_rate: float = 10.0,
+    checkpoint_interval: int = 100,
+    bloom_capacity: int = 0,
+    recrawl: bool = False,
+    extract: bool = False,
+    max_retries: int = 2,
+) -> None:
+    """基于asyncio的bfs爬虫；连接池复用keep-alive连接，按host限制并发和速率；
+    保存目录结构、断点续爬状态(crawler_seen.fp, crawler_frontier.log)和条件请求的记录(crawler_pages.jsonl)
+    与links_scraper_bfs_parallel相同；抓取失败的url同样重新排到队尾，最多重试max_retries次
+
+    Args:
+        url (str): 爬虫的起点url
+        domain (str): 想要域名
+        save_path (str): 保存的base路径
+        max_depth (int, optional): bfs最大深度. Defaults to 12.
+        concurrency (int, optional): 同时进行的请求数. Defaults to 200.
+        per_host_concurrency (int, optional): 每个host同时进行的请求数. Defaults to 8.
+        per_host_rate (float, optional): 每个host每秒的请求数，<=0表示不限速. Defaults to 10.0.
+        checkpoint_interval (int, optional): 每完成多少个请求保存一次状态. Defaults to 100.
+        bloom_capacity (int, optional): url指纹集合前布隆过滤器的容量，0表示不使用. Defaults to 0.
+        recrawl (bool, optional): 上次已经爬完时从起点重新爬一遍（未完成时仍然续爬）. Defaults to False.
+        extract (bool, optional): 单次解析，同时保存index_record.json，见store_page. Defaults to False.
+        max_retries (int, optional): 每个url抓取失败后最多重试的次数. Defaults to 2.
+    """
+    configure_logging(save_path)
+    seen, frontier = open_crawl_state(
+        save_path, url, bloom_capacity=bloom_capacity, restart=recrawl
+    )
+    page_cache = PageCache(save_path)
+
+    host_limits = HostLimits(per_host_concurrency, per_host_rate)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host_concurrency)
+    timeout = aiohttp.ClientTimeout(total=10)
+    retries = {}
+
+    async with aiohttp.ClientSession(
+        connector=connector, headers=HEADERS, timeout=timeout
+    ) as session:
+        tasks = {}
+        completed = 0
+        while len(frontier) or tasks:
+            while len(tasks) < concurrency:
+                item = frontier.pop()
+                if item is None:
+                    break
+                current_url, current_depth, offset = item
+                task = asyncio.create_task(
+                    fetch_page_async(
+                        session,
+                        host_limits,
+                        current_url,
+                        current_depth,
+                        domain,
+                        save_path,
+                        max_depth,
+                        page_cache,
+                        extract,
+                    )
+                )
+                tasks[task] = (offset, current_url, current_depth)
+
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                offset, current_url, current_depth = tasks.pop(task)
+                found_links, next_depth = task.result()
+                if found_links is None and retries.get(current_url, 0) < max_retries:
+                    retries[current_url] = retries.get(current_url, 0) + 1
+                    frontier.push(current_url, current_depth)
+                frontier.done(offset)
+                if not found_links or next_depth is None:
+                    continue
+                for link in found_links:
+                    if seen.add(link):
+                        frontier.push(link, next_depth)
+
+            completed += len(done)
+            if completed >= checkpoint_interval:
+                completed = 0
+                # cursor停在最早的进行中请求处，中断后续爬时会重新抓取
+                frontier.checkpoint()
+                seen.checkpoint()
+                page_cache.checkpoint()
+
+        frontier.close()
+        seen.checkpoint()
+        page_cache.checkpoint()
+
+
+def links_scraper_async_run(url: str, domain: str, save_path: str, **kwargs) -> None:
+    """同步入口，参数同links_scraper_async"""
+    asyncio.run(links_scraper_async(url, domain, save_path, **kwargs))
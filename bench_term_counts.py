@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+from ii_tc import build_term_counts
+from utils import read_segmented_and_content
+
+
+def legacy_term_counts(index_segmented: list, index_content: str) -> dict:
+    """原实现：对分词表中的每个词（包括重复的词）都扫描一遍原文"""
+    term_count = {}
+    for term in index_segmented:
+        term_count[term] = index_content.count(term)
+    return term_count
+
+
+def load_pages(save_path: str) -> list[tuple]:
+    pages = []
+    for root, _, files in os.walk(save_path):
+        if "index_segmented.txt" in files and "index_content.txt" in files:
+            pages.append(
+                read_segmented_and_content(
+                    os.path.join(root, "index_segmented.txt"),
+                    os.path.join(root, "index_content.txt"),
+                )
+            )
+    return pages
+
+
+def bench(save_path: str) -> None:
+    """在已保存的网页上比较各种词频统计方式的耗时
+
+    Args:
+        save_path (str): 已经完成分词的域名目录，如 saved/https_gsai.ruc.edu.cn
+    """
+    pages = load_pages(save_path)
+    tokens = sum(len(segmented) for segmented, _ in pages)
+    chars = sum(len(content) for _, content in pages)
+    print(f"{len(pages)} pages, {tokens} tokens, {chars} chars")
+
+    start = time.perf_counter()
+    expected = [legacy_term_counts(segmented, content) for segmented, content in pages]
+    legacy = time.perf_counter() - start
+    print(f"legacy    {legacy:8.3f}s")
+
+    for count_mode in ("substring", "token"):
+        start = time.perf_counter()
+        results = [
+            build_term_counts(segmented, content, count_mode)
+            for segmented, content in pages
+        ]
+        elapsed = time.perf_counter() - start
+        line = f"{count_mode:<9} {elapsed:8.3f}s  x{legacy / elapsed:.1f}"
+        if count_mode == "substring":
+            line += "  identical" if results == expected else "  MISMATCH"
+        print(line)
+
+
+if __name__ == "__main__":
+    bench(sys.argv[1] if len(sys.argv) > 1 else "saved")
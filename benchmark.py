@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import jieba
+import numpy as np
+
+from crawler import links_scraper_bfs_parallel, page_path, CrawlStats
+from tokenizer import token4search, segment_query
+from ii_tc import ii_tc_build_and_save
+from docstore import build_docstore, docstore_path, load_docstores
+from incremental import record_doc_manifest
+from index_manager import load_federated
+from query import query_request, query_booster
+from main import domain_segment_path
+from build import update_build_status
+from utils import url_to_path
+
+
+BENCH_DOMAINS = ("https://a.bench.test", "http://b.bench.test")
+VOCABULARY = (
+    "搜索 引擎 情感 分析 文档 句子 级别 人工 智能 学院 研究 机器 学习 深度 网络 模型 数据 "
+    "算法 自然 语言 处理 细粒度 发展 领域 传统 维度 显著 检索 排序 索引 分布式 系统 优化 "
+    "图像 识别 语音 推荐 知识 图谱 预训练 评测 实验 论文 课程 教授 学生 项目 开源"
+).split()
+# 索引文件和目录，用于统计索引占用的磁盘空间
+INDEX_ARTIFACTS = (
+    "segments",
+    "docstore.bin",
+)
+
+
+def page_html(rng: random.Random, pages: int) -> str:
+    """生成一个网页：标题、几个小标题和段落、列表项以及指向同域名其他网页的链接"""
+    title = "".join(rng.sample(VOCABULARY, 3))
+    sections = "".join(
+        f"<h2>{''.join(rng.sample(VOCABULARY, 2))}</h2>"
+        f"<p>{''.join(rng.choices(VOCABULARY, k=rng.randint(30, 120)))}</p>"
+        f"<li>{''.join(rng.sample(VOCABULARY, 3))}</li>"
+        for _ in range(rng.randint(2, 5))
+    )
+    links = "".join(
+        f'<a href="{f"/p{j}/" if j else "/"}">link</a>' for j in rng.sample(range(pages), min(6, pages))
+    )
+    return f"<html><head><title>{title}</title></head><body>{sections}{links}</body></html>"
+
+
+def generate_corpus(root: str, domains=BENCH_DOMAINS, pages: int = 200, seed: int = 0) -> int:
+    """按爬虫的保存结构(root/<scheme>_<host>/<path>/index.html)生成合成网页，同样的参数生成同样的网页
+
+    Args:
+        root (str): 保存地址根目录
+        domains (tuple, optional): 域名. Defaults to BENCH_DOMAINS.
+        pages (int, optional): 每个域名的网页数，第0个网页是域名首页. Defaults to 200.
+        seed (int, optional): 随机种子. Defaults to 0.
+
+    Returns:
+        int: 生成的网页总数
+    """
+    rng = random.Random(seed)
+    for domain in domains:
+        save_path = url_to_path(domain, root)
+        for i in range(pages):
+            file_path = page_path(domain if i == 0 else f"{domain}/p{i}/", save_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(page_html(rng, pages))
+    return len(domains) * pages
+
+
+def generate_queries(count: int, seed: int = 0) -> list[str]:
+    """由词表随机拼出query，长度1到4个词"""
+    rng = random.Random(seed)
+    return ["".join(rng.sample(VOCABULARY, rng.randint(1, 4))) for _ in range(count)]
+
+
+def percentiles(samples: list[float]) -> dict:
+    """延迟的统计（毫秒）"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def peak_rss() -> dict:
+    """当前进程和已结束的子进程（分词进程池）的峰值内存（字节）"""
+    # Linux上ru_maxrss的单位是KB，macOS上是字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def disk_usage(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(directory, file))
+    return total
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def bench_crawl(fixture_path: str, workdir: str, max_workers: int = 6) -> dict:
+    """把一个域名的合成网页用本地http服务提供，爬虫（不限速）抓取到临时目录
+
+    Args:
+        fixture_path (str): 合成网页所在的域名目录
+        workdir (str): 临时目录
+        max_workers (int, optional): 爬虫线程数. Defaults to 6.
+    """
+    handler = partial(QuietHandler, directory=fixture_path)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        save_path = url_to_path(url, os.path.join(workdir, "crawl"))
+        stats = CrawlStats()
+        start = time.perf_counter()
+        links_scraper_bfs_parallel(
+            url=url,
+            domain=url,
+            save_path=save_path,
+            max_depth=32,
+            max_workers=max_workers,
+            rate=0,
+            stats=stats,
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "pages": stats.fetched,
+        "failed": stats.failed,
+        "seconds": elapsed,
+        "pages_per_second": stats.fetched / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def bench_build(root: str, domains, stopwords_dir: str, workers: int) -> dict:
+    """按build_one_domain的顺序构建每个域名（不包括爬取），记录各阶段耗时"""
+    # jieba词典先加载，不计入第一个域名的分词时间
+    jieba.initialize()
+    results = {}
+    for domain in domains:
+        save_path = url_to_path(domain, root)
+        stage = {}
+
+        start = time.perf_counter()
+        token4search(stopwords_dir=stopwords_dir, save_path=save_path, workers=workers)
+        stage["tokenize_seconds"] = time.perf_counter() - start
+        pages = sum(
+            1 for _, _, files in os.walk(save_path) if "index_segmented.txt" in files
+        )
+        stage["pages"] = pages
+        stage["tokenize_pages_per_second"] = (
+            pages / stage["tokenize_seconds"] if stage["tokenize_seconds"] > 0 else 0.0
+        )
+        update_build_status(root, domain, "tokenize")
+
+        start = time.perf_counter()
+        ii_tc_build_and_save(save_path)
+        build_docstore(save_path)
+        record_doc_manifest(save_path)
+        stage["ii_tc_seconds"] = time.perf_counter() - start
+        update_build_status(root, domain, "ii-tc")
+
+        results[domain] = stage
+    return results
+
+
+def bench_index_size(root: str, domains) -> dict:
+    results = {}
+    for domain in domains:
+        save_path = url_to_path(domain, root)
+        sizes = {
+            name: disk_usage(os.path.join(save_path, name))
+            for name in INDEX_ARTIFACTS
+            if os.path.exists(os.path.join(save_path, name))
+        }
+        sizes["total"] = sum(sizes.values())
+        results[domain] = sizes
+    return results
+
+
+def bench_queries(
+    root: str, domains, stopwords_dir: str, queries: list[str], top_k: int, repeat: int
+) -> dict:
+    """query_request和query_booster的延迟
+
+    冷查询：每次都重新打开索引（段文件和清单）或文档存储，包括加载时间；
+    热查询：复用已经打开的索引和文档存储，每个query重复repeat次
+    """
+    segment_paths = [domain_segment_path(domain, root) for domain in sorted(domains)]
+    paths = [docstore_path(url_to_path(domain, root)) for domain in sorted(domains)]
+    # jieba词典和停用词先加载，不计入第一个query
+    segment_query(queries[0], stopwords_dir)
+
+    def request(index, query):
+        return query_request(
+            query=query,
+            stopwords_dir=stopwords_dir,
+            dict_path=None,
+            root=root,
+            top_k=top_k,
+            tf_idf_dict=None,
+            inverted_index=index,
+            doc_matrix=index,
+        )
+
+    cold_request, cold_booster = [], []
+    for query in queries:
+        start = time.perf_counter()
+        index = load_federated(segment_paths)
+        top_k_docs, query_segs = request(index, query)
+        cold_request.append(time.perf_counter() - start)
+
+        docs = [index.doc_name(doc_id) for doc_id in top_k_docs]
+        start = time.perf_counter()
+        query_booster(docs, query, query_segs, load_docstores(paths))
+        cold_booster.append(time.perf_counter() - start)
+
+    index = load_federated(segment_paths)
+    docstore = load_docstores(paths)
+    warm_request, warm_booster = [], []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            top_k_docs, query_segs = request(index, query)
+            warm_request.append(time.perf_counter() - start)
+
+            docs = [index.doc_name(doc_id) for doc_id in top_k_docs]
+            start = time.perf_counter()
+            query_booster(docs, query, query_segs, docstore)
+            warm_booster.append(time.perf_counter() - start)
+
+    return {
+        "documents": len(index),
+        "query_request": {"cold": percentiles(cold_request), "warm": percentiles(warm_request)},
+        "query_booster": {"cold": percentiles(cold_booster), "warm": percentiles(warm_booster)},
+    }
+
+
+def bench_search(workdir: str, domains, queries: list[str]) -> dict:
+    """用Flask测试客户端请求/search：第一遍结果缓存未命中，第二遍全部命中"""
+    from app import app
+    from result_cache import result_cache
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        client = app.test_client()
+        result_cache.clear()
+        results = {}
+        for name in ("uncached", "cached"):
+            latencies = []
+            start = time.perf_counter()
+            for query in queries:
+                request_start = time.perf_counter()
+                response = client.post("/search", json={"query": query, "domains": list(domains)})
+                if response.status_code != 200:
+                    raise RuntimeError(f"/search failed with status {response.status_code}")
+                latencies.append(time.perf_counter() - request_start)
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "requests": len(queries),
+                "seconds": elapsed,
+                "requests_per_second": len(queries) / elapsed if elapsed > 0 else 0.0,
+                "latency": percentiles(latencies),
+            }
+        results["cache"] = result_cache.stats()
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    output: str,
+    pages: int = 200,
+    queries: int = 50,
+    repeat: int = 3,
+    top_k: int = 60,
+    workers: int = 1,
+    seed: int = 0,
+    stopwords_dir: str = "stopwords-master",
+    workdir: str = None,
+    skip_crawl: bool = False,
+) -> dict:
+    """在合成语料上运行全部基准测试，结果写成json
+
+    Args:
+        output (str): 结果json路径
+        pages (int, optional): 每个域名的网页数. Defaults to 200.
+        queries (int, optional): query数. Defaults to 50.
+        repeat (int, optional): 热查询每个query的重复次数. Defaults to 3.
+        top_k (int, optional): 重排序前的检索数量. Defaults to 60.
+        workers (int, optional): 分词进程数. Defaults to 1.
+        seed (int, optional): 语料和query的随机种子. Defaults to 0.
+        stopwords_dir (str, optional): 停用词目录. Defaults to "stopwords-master".
+        workdir (str, optional): 工作目录，None时使用临时目录并在结束后删除. Defaults to None.
+        skip_crawl (bool, optional): 不测爬虫. Defaults to False.
+
+    Returns:
+        dict: 结果
+    """
+    stopwords_dir = os.path.abspath(stopwords_dir)
+    cleanup = workdir is None
+    workdir = tempfile.mkdtemp(prefix="csearch-bench-") if workdir is None else workdir
+    root = os.path.join(workdir, "saved")
+    os.makedirs(root, exist_ok=True)
+    # /search使用相对路径的saved和stopwords-master
+    if not os.path.exists(os.path.join(workdir, "stopwords-master")):
+        os.symlink(stopwords_dir, os.path.join(workdir, "stopwords-master"))
+
+    query_list = generate_queries(queries, seed)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "domains": list(BENCH_DOMAINS),
+                "pages_per_domain": pages,
+                "queries": queries,
+                "repeat": repeat,
+                "top_k": top_k,
+                "tokenize_workers": workers,
+                "seed": seed,
+            },
+        }
+    }
+    stages = []
+
+    def stage(name: str, target, *args, **kwargs) -> None:
+        print(f"[benchmark] {name} ...")
+        start = time.perf_counter()
+        results[name] = target(*args, **kwargs)
+        stages.append({"stage": name, "seconds": time.perf_counter() - start, **peak_rss()})
+
+    try:
+        stage("corpus", lambda: {"pages": generate_corpus(root, BENCH_DOMAINS, pages, seed)})
+        if not skip_crawl:
+            stage(
+                "crawl", bench_crawl, url_to_path(BENCH_DOMAINS[0], root), workdir
+            )
+        stage("build", bench_build, root, BENCH_DOMAINS, stopwords_dir, workers)
+        stage("index_size", bench_index_size, root, BENCH_DOMAINS)
+        stage(
+            "query", bench_queries, root, BENCH_DOMAINS, stopwords_dir, query_list, top_k, repeat
+        )
+        stage("search", bench_search, workdir, BENCH_DOMAINS, query_list)
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # 每个阶段结束时的峰值内存（单调不减），以及整体峰值
+    results["stages"] = stages
+    results["peak_rss"] = peak_rss()
+
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, output)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在合成语料上测试爬取、构建和查询各阶段的性能")
+    parser.add_argument("--output", default="benchmark.json", help="结果json路径")
+    parser.add_argument("--pages", type=int, default=200, help="每个域名的网页数")
+    parser.add_argument("--queries", type=int, default=50, help="query数")
+    parser.add_argument("--repeat", type=int, default=3, help="热查询的重复次数")
+    parser.add_argument("--top-k", type=int, default=60, help="重排序前的检索数量")
+    parser.add_argument("--workers", type=int, default=1, help="分词进程数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--stopwords", default="stopwords-master", help="停用词目录")
+    parser.add_argument("--workdir", default=None, help="工作目录，默认使用临时目录")
+    parser.add_argument("--skip-crawl", action="store_true", help="不测爬虫")
+    args = parser.parse_args()
+
+    run(
+        output=args.output,
+        pages=args.pages,
+        queries=args.queries,
+        repeat=args.repeat,
+        top_k=args.top_k,
+        workers=args.workers,
+        seed=args.seed,
+        stopwords_dir=args.stopwords,
+        workdir=args.workdir,
+        skip_crawl=args.skip_crawl,
+    )
+    print(f"[benchmark] results written to {args.output}")
@@ -1,27 +1,32 @@
 import os
 import json
+import threading
 from datetime import datetime
 from collections import defaultdict
 
 
+# 读取-修改-写回构建状态时加锁，多个域名的流水线构建在不同线程中同时更新版本号时不会丢失更新
+_status_lock = threading.RLock()
+
+
 def read_build_status(build_marker_path):
-    """读取标记文件，返回构建状态的字典"""
+    """读取标记文件，返回构建状态的字典；标记文件不存在时返回空字典，不创建文件"""
     build_marker_path = os.path.join(build_marker_path, "build.json")
     if os.path.exists(build_marker_path):
         with open(build_marker_path, "r") as f:
             return json.load(f)
 
-    with open(build_marker_path, "w") as f:
-        json.dump({}, f, indent=4)
-
     return {}
 
 
 def write_build_status(build_marker_path, status_dict):
-    """写入构建状态到标记文件"""
+    """写入构建状态到标记文件；先写临时文件再原子替换，并发读取（read_generations）不会读到写了一半的文件"""
+    os.makedirs(build_marker_path, exist_ok=True)
     build_marker_path = os.path.join(build_marker_path, "build.json")
-    with open(build_marker_path, "w") as f:
+    tmp_path = f"{build_marker_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(status_dict, f, indent=4)
+    os.replace(tmp_path, build_marker_path)
 
 
 def check_build_status(build_marker_path, domain, component):
@@ -34,13 +39,14 @@ def check_build_status(build_marker_path, domain, component):
     Returns:
         bool: 如果组件已经构建完成，返回 False 否则返回 True
     """
-    build_status = read_build_status(build_marker_path)
-    if domain not in build_status:
-        build_status.update(
-            {domain: {component: {"status": "incomplete", "time": None}}}
-        )
-        write_build_status(build_marker_path, build_status)
-        return True
+    with _status_lock:
+        build_status = read_build_status(build_marker_path)
+        if domain not in build_status:
+            build_status.update(
+                {domain: {component: {"status": "incomplete", "time": None}}}
+            )
+            write_build_status(build_marker_path, build_status)
+            return True
     
     domain_status = build_status.get(domain, {})
     component_status = domain_status.get(component, {})
@@ -52,24 +58,62 @@ def check_build_status(build_marker_path, domain, component):
 
 
 def update_build_status(build_marker_path, domain, component):
-    """更新指定组件的构建状态为已完成
+    """更新指定组件的构建状态为已完成，同时增加域名的索引版本号(generation)，
+    以版本号为键的查询结果缓存随之失效
 
     Args:
         build_marker_path (str): 构建状态标记文件路径
         component (str): 组件名称
     """
-    build_status = read_build_status(build_marker_path)
-    time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    if domain not in build_status:
-        build_status.update({domain: {component: {"status": "complete", "time": time}}})
-    else:
-        build_status[domain].update({component: {"status": "complete", "time": time}})
-    print(f"domain: {domain} ||| {component} ||| at {time}.")
-    write_build_status(build_marker_path, build_status)
+    with _status_lock:
+        build_status = read_build_status(build_marker_path)
+        time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if domain not in build_status:
+            build_status.update({domain: {component: {"status": "complete", "time": time}}})
+        else:
+            build_status[domain].update({component: {"status": "complete", "time": time}})
+        _increment_generation(build_status, domain)
+        print(f"domain: {domain} ||| {component} ||| at {time}.")
+        write_build_status(build_marker_path, build_status)
+
+
+def bump_generation(build_marker_path, domain):
+    """只增加域名的索引版本号，不改变各组件的构建状态；用于增量更新等不重建任何组件的索引变化
+
+    Args:
+        build_marker_path (str): 构建状态标记文件路径
+        domain (str): 域名
+    """
+    with _status_lock:
+        build_status = read_build_status(build_marker_path)
+        _increment_generation(build_status, domain)
+        write_build_status(build_marker_path, build_status)
+
+
+def _increment_generation(build_status, domain):
+    domain_status = build_status.setdefault(domain, {})
+    domain_status["generation"] = domain_status.get("generation", 0) + 1
 
 
 def reset_build_status(build_marker_path, domain, component):
     """重置构建component状态"""
+    with _status_lock:
+        build_status = read_build_status(build_marker_path)
+        build_status[domain].update({component: {"status": "incomplete", "time": None}})
+        write_build_status(build_marker_path, build_status)
+
+
+def read_generations(build_marker_path, domains) -> tuple:
+    """读取多个域名的索引版本号，按域名排序；从未构建过的域名为0
+
+    Args:
+        build_marker_path (str): 构建状态标记文件路径
+        domains: 域名
+
+    Returns:
+        tuple: 与排好序的域名对齐的版本号
+    """
     build_status = read_build_status(build_marker_path)
-    build_status[domain].update({component: {"status": "incomplete", "time": None}})
-    write_build_status(build_marker_path, build_status)
\ No newline at end of file
+    return tuple(
+        build_status.get(domain, {}).get("generation", 0) for domain in sorted(domains)
+    )
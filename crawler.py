@@ -1,15 +1,17 @@
 import os
+import time
 import logging
 import threading
 import requests
-from time import sleep
 from bs4 import BeautifulSoup
-from collections import deque
 from url_normalize import url_normalize
 from urllib.parse import urlparse, urljoin, urldefrag
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait
-from utils import configure_logging, save_state, load_state, url_to_path
-import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import configure_logging, url_to_path
+from ratelimit import TokenBucket
+from frontier import open_crawl_state
+from page_cache import PageCache, content_digest
+from extract import FAST_PARSER, page_record, save_record, load_record, remove_record
 
 
 HEADERS = {
@@ -17,29 +19,51 @@ HEADERS = {
 }
 
 
-def soup_maker(url: str) -> BeautifulSoup:
-    """输入url，使用requests库抓取取网页内容，返回BeautifulSoup对象
-
-    Args:
-        url (str): 目标网页
-
-    Returns:
-        BeautifulSoup: bs4.BeautifulSoup 对象
-    """
-    try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.encoding = response.apparent_encoding
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        logging.error(f"HTTP error: {e} - URL: {url}")
-        return None
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Request error: {e} - URL: {url}")
-        return None
-
-    html_doc = response.text
-    soup = BeautifulSoup(html_doc, "html.parser")
-    return soup
+class CrawlStats:
+    """爬虫运行时的计数器，可以在其他线程中随时读取"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.fetched = 0
+        self.failed = 0
+        self.not_modified = 0
+        self.unchanged = 0
+        self.written = 0
+        self.discovered = 0
+        self.queue_depth = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def pages_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.fetched / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "fetched": self.fetched,
+            "failed": self.failed,
+            "not_modified": self.not_modified,
+            "unchanged": self.unchanged,
+            "written": self.written,
+            "discovered": self.discovered,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "pages_per_second": self.pages_per_second,
+        }
+
+
+def page_path(url: str, save_path: str) -> str:
+    """url对应的html保存路径：url路径下的index.html"""
+    path = urlparse(url).path.strip("/")
+    if not path:  # 如果 URL 没有路径，将其保存为 index.html
+        return os.path.join(save_path, "index.html")
+    return os.path.join(save_path, path, "index.html")
 
 
 def save_soup(soup: BeautifulSoup, url: str, save_path: str) -> None:
@@ -50,18 +74,11 @@ def save_soup(soup: BeautifulSoup, url: str, save_path: str) -> None:
         url (str): _description_
         save_path (str): 根目录，网页的域名
     """
-    parsed_url = urlparse(url)
-    path = parsed_url.path.strip("/")
-    if not path:  # 如果 URL 没有路径，将其保存为 index.html
-        path = "index.html"
-    else:
-        path = os.path.join(path, "index.html")
+    save_file_path = page_path(url, save_path)
+    save_dir = os.path.dirname(save_file_path)
 
     try:
-        save_dir = os.path.join(save_path, os.path.dirname(path))
         os.makedirs(save_dir, exist_ok=True)
-
-        save_file_path = os.path.join(save_dir, os.path.basename(path))
         with open(save_file_path, "w", encoding="utf-8") as file:
             file.write(str(soup))
 
@@ -69,6 +86,42 @@ def save_soup(soup: BeautifulSoup, url: str, save_path: str) -> None:
         logging.error(f"File exists error: {e} - URL: {url} - path:{save_dir}")
 
 
+def load_saved_soup(file_path: str) -> BeautifulSoup:
+    """读取已保存的网页（服务器返回304时从中提取链接）"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return BeautifulSoup(f.read(), "html.parser")
+
+
+def conditional_get(url: str, validators: dict = None) -> requests.Response:
+    """带条件请求头抓取网页：有上次的ETag/Last-Modified时服务器可以直接返回304
+
+    Args:
+        url (str): 目标网页
+        validators (dict, optional): PageCache中的记录. Defaults to None.
+
+    Returns:
+        requests.Response: 状态码为200或304的响应，失败时返回None
+    """
+    headers = dict(HEADERS)
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    try:
+        response = requests.get(url, headers=headers, timeout=10)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        logging.error(f"HTTP error: {e} - URL: {url}")
+        return None
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Request error: {e} - URL: {url}")
+        return None
+    return response
+
+
 def links_scraper_sp(soup: BeautifulSoup, url: str, domain: str) -> set:
     """提取单个网页中的所有链接，添加过滤规则，比如必须在指定域名domain下，必须是.html后缀等
 
@@ -103,52 +156,182 @@ def links_scraper_sp(soup: BeautifulSoup, url: str, domain: str) -> set:
     return all_links
 
 
-def process_link(
+def store_page(
+    current_url: str,
+    file_path: str,
+    status: int,
+    content: bytes,
+    decode,
+    headers,
+    validators: dict,
+    domain: str,
+    save_path: str,
+    page_cache: PageCache = None,
+    stats: CrawlStats = None,
+    extract: bool = False,
+) -> set:
+    """处理一次（条件）请求的响应：只在内容变化时写盘，返回页面中的链接
+
+    304或内容哈希不变时不重写html，链接从已保存的记录或网页中提取。
+    extract为True时只用FAST_PARSER解析一次，同时得到链接、标题、小标题和正文，
+    保存为html同目录下的index_record.json，html按原样保存不再prettify；
+    分词和结果展示直接读取记录，不再解析html。
+    记录的正文由FAST_PARSER直接解析原始html得到，而不是用html.parser解析prettify之后的html；
+    对不规范的html（如嵌套的<p>）两者提取的正文可能不同，因此开启extract后词频可能与不开启时不同
+
+    Args:
+        current_url (str): 网页url
+        file_path (str): html保存路径
+        status (int): 响应状态码
+        content (bytes): 响应原始内容
+        decode (callable): 返回解码后html文本的函数，只在需要解析时调用
+        headers (Mapping): 响应头
+        validators (dict): 上次的验证器和内容哈希，没有时为None
+        domain (str): 当前网站的根域名
+        save_path (str): html保存路径
+        page_cache (PageCache, optional): 每个url的验证器和内容哈希. Defaults to None.
+        stats (CrawlStats, optional): 计数器. Defaults to None.
+        extract (bool, optional): 是否使用单次解析并保存页面记录. Defaults to False.
+
+    Returns:
+        set: 页面中的链接
+    """
+    digest = content_digest(content) if status != 304 else None
+    unchanged = status == 304 or (validators is not None and validators["sha1"] == digest)
+    record = load_record(file_path) if extract and unchanged else None
+    if record is not None:
+        links = set(record["links"])
+    elif status == 304:
+        links = links_scraper_sp(
+            soup=load_saved_soup(file_path), url=current_url, domain=domain
+        )
+    else:
+        html_doc = decode()
+        soup = BeautifulSoup(html_doc, FAST_PARSER if extract else "html.parser")
+        links = links_scraper_sp(soup=soup, url=current_url, domain=domain)
+
+    if not unchanged:
+        if extract:
+            save_soup(html_doc, current_url, save_path)
+            save_record(page_record(soup, current_url, links), file_path)
+        else:
+            save_soup(soup.prettify(), current_url, save_path)
+            remove_record(file_path)
+        if page_cache is not None:
+            page_cache.mark_changed(file_path)
+    elif extract and record is None and status != 304:
+        # 内容没变但还没有记录（之前没有使用单次解析）
+        save_record(page_record(soup, current_url, links), file_path)
+
+    if status != 304 and page_cache is not None:
+        page_cache.record(
+            current_url,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+            digest,
+        )
+
+    if stats is not None:
+        if status == 304:
+            stats.add(fetched=1, not_modified=1)
+        elif unchanged:
+            stats.add(fetched=1, unchanged=1)
+        else:
+            stats.add(fetched=1, written=1)
+    return links
+
+
+def fetch_page(
     current_url: str,
     current_depth: int,
     domain: str,
     save_path: str,
-    fp_links: set,
     max_depth: int,
-    lock: threading.Lock  # 新增参数
+    rate_limiter: TokenBucket = None,
+    stats: CrawlStats = None,
+    page_cache: PageCache = None,
+    extract: bool = False,
 ) -> tuple:
-    """bfs 并行处理链接的模块
+    """抓取并保存一个网页，提取页面中的链接（去重交给调用方）
+
+    传入page_cache时发送条件请求，只有内容变化的网页才重写并记入page_cache的变化清单，见store_page
 
     Args:
         current_url (str): 当前要处理的url
         current_depth (int): 当前url所在的深度
         domain (str): 当前网站的根域名
         save_path (str): html保存路径
-        fp_links (set): 已经处理过的链接
         max_depth (int): 最大深度
+        rate_limiter (TokenBucket, optional): 请求前先取令牌. Defaults to None.
+        stats (CrawlStats, optional): 计数器. Defaults to None.
+        page_cache (PageCache, optional): 每个url的验证器和内容哈希. Defaults to None.
+        extract (bool, optional): 单次解析并保存页面记录，见store_page. Defaults to False.
 
     Returns:
-        tuple: (新链接，下一层深度)
+        tuple: (页面中的链接，下一层深度)；抓取失败时为(None, None)，已到最大深度时为(set(), None)
     """
-    with lock:
-        if current_url in fp_links or current_depth > max_depth:
-            return None, None
-
-    soup = soup_maker(current_url)
-    if soup is None:
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+
+    file_path = page_path(current_url, save_path)
+    validators = page_cache.get(current_url) if page_cache is not None else None
+    if validators is not None and not os.path.exists(file_path):
+        validators = None
+
+    response = conditional_get(current_url, validators)
+    if response is None:
+        if stats is not None:
+            stats.add(failed=1)
         return None, None
 
-    save_soup(soup.prettify(), current_url, save_path)
-    with lock:
-        fp_links.add(current_url)
+    def decode() -> str:
+        response.encoding = response.apparent_encoding
+        return response.text
+
+    links = store_page(
+        current_url,
+        file_path,
+        response.status_code,
+        response.content,
+        decode,
+        response.headers,
+        validators,
+        domain,
+        save_path,
+        page_cache,
+        stats,
+        extract,
+    )
 
     if current_depth < max_depth:
-        found_links = links_scraper_sp(soup=soup, url=current_url, domain=domain)
-        new_links = found_links - fp_links
-        return new_links, current_depth + 1
+        return links, current_depth + 1
 
-    return None, None
+    return set(), None
 
 
 def links_scraper_bfs_parallel(
-    url: str, domain: str, save_path: str, max_depth: int = 12, max_workers: int = 6
-)->None:
-    """bfs并行爬虫；使用ThreadPoolExecutor；支持断点续爬，使用pickle保存状态；爬取情况会记录在save_path/crawler.log中
+    url: str,
+    domain: str,
+    save_path: str,
+    max_depth: int = 12,
+    max_workers: int = 6,
+    rate: float = 10.0,
+    checkpoint_interval: int = 100,
+    stats: CrawlStats = None,
+    bloom_capacity: int = 0,
+    recrawl: bool = False,
+    extract: bool = False,
+    on_page=None,
+    max_retries: int = 2,
+) -> CrawlStats:
+    """bfs并行爬虫；使用ThreadPoolExecutor；支持断点续爬；爬取情况会记录在save_path/crawler.log中
+
+    新发现的链接立即提交，不等整层处理完，线程池始终保持满载；请求速率由令牌桶控制。
+    已见过的url以64位指纹保存(crawler_seen.fp)，待爬队列是磁盘上只追加的日志(crawler_frontier.log)，
+    checkpoint只写增量；旧版的crawler_state.pkl会在第一次运行时迁移过来。
+    每个url的ETag/Last-Modified和内容哈希保存在crawler_pages.jsonl，重新爬取时用条件请求，
+    没有变化的网页不重写，有变化的网页记录在changed_pages.txt。
+    抓取失败（超时、5xx等）的url重新排到队尾，最多重试max_retries次
 
     Args:
         url (str): 爬虫的起点url
@@ -156,43 +339,90 @@ def links_scraper_bfs_parallel(
         save_path (str): 保存的base路径
         max_depth (int, optional): bfs最大深度. Defaults to 12.
         max_workers (int, optional): 并行数量. Defaults to 6.
+        rate (float, optional): 每秒最多请求数，<=0表示不限速. Defaults to 10.0.
+        checkpoint_interval (int, optional): 每完成多少个请求保存一次状态. Defaults to 100.
+        stats (CrawlStats, optional): 计数器，传入后可在其他线程观察队列深度和抓取速度. Defaults to None.
+        bloom_capacity (int, optional): url指纹集合前布隆过滤器的容量，0表示不使用. Defaults to 0.
+        recrawl (bool, optional): 上次已经爬完时从起点重新爬一遍（未完成时仍然续爬）. Defaults to False.
+        extract (bool, optional): 单次解析，同时保存index_record.json，见store_page. Defaults to False.
+        on_page (callable, optional): 每个成功抓取的网页在调度线程中回调on_page(html路径)，
+            用于流水线构建；回调阻塞时爬虫暂停提交新请求. Defaults to None.
+        max_retries (int, optional): 每个url抓取失败后最多重试的次数. Defaults to 2.
+
+    Returns:
+        CrawlStats: 计数器
     """
     configure_logging(save_path)
-    fp_links, queue = load_state(save_path)
+    seen, frontier = open_crawl_state(
+        save_path, url, bloom_capacity=bloom_capacity, restart=recrawl
+    )
+    page_cache = PageCache(save_path)
 
-    if not queue:
-        queue = deque([(url, 0)])
-    if not fp_links:
-        fp_links = set()
+    if stats is None:
+        stats = CrawlStats()
 
-    lock = threading.Lock()
+    rate_limiter = TokenBucket(rate, capacity=max_workers)
+    # 每个url已经重试的次数，只在本次运行内计数
+    retries = {}
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        while queue or futures:
-            while queue:
-                current_url, current_depth = queue.popleft()
+        futures = {}
+        completed = 0
+        while len(frontier) or futures:
+            # 多提交一些任务，保证线程结束一个任务后马上有下一个
+            while len(futures) < max_workers * 2:
+                item = frontier.pop()
+                if item is None:
+                    break
+                current_url, current_depth, offset = item
                 future = executor.submit(
-                    process_link,
+                    fetch_page,
                     current_url,
                     current_depth,
                     domain,
                     save_path,
-                    fp_links,
                     max_depth,
-                    lock,
+                    rate_limiter,
+                    stats,
+                    page_cache,
+                    extract,
                 )
-                futures.append(future)
-
-            for future in as_completed(futures):
-                futures.remove(future)
-                result = future.result()
-                if result:
-                    new_links, next_depth = result
-                    if new_links:
-                        queue.extend([(link, next_depth) for link in new_links])
-                sleep(0.1)
-
-            save_state(fp_links, queue, save_path)
-
-        wait(futures)
\ No newline at end of file
+                futures[future] = (offset, current_url, current_depth)
+
+            stats.queue_depth = len(frontier)
+            stats.in_flight = len(futures)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                offset, current_url, current_depth = futures.pop(future)
+                found_links, next_depth = future.result()
+                if found_links is None and retries.get(current_url, 0) < max_retries:
+                    # url在发现时已经记入指纹集合，失败时直接放回队列，否则不会再被抓取
+                    retries[current_url] = retries.get(current_url, 0) + 1
+                    frontier.push(current_url, current_depth)
+                frontier.done(offset)
+                if on_page is not None and found_links is not None:
+                    on_page(page_path(current_url, save_path))
+                if not found_links or next_depth is None:
+                    continue
+                for link in found_links:
+                    # url第一次被发现时就记入指纹集合，队列里不会有重复
+                    if seen.add(link):
+                        frontier.push(link, next_depth)
+                        stats.add(discovered=1)
+
+            completed += len(done)
+            if completed >= checkpoint_interval:
+                completed = 0
+                frontier.checkpoint()
+                seen.checkpoint()
+                page_cache.checkpoint()
+                logging.info(f"crawl stats: {stats.snapshot()}")
+
+    frontier.close()
+    seen.checkpoint()
+    page_cache.checkpoint()
+    stats.queue_depth = 0
+    stats.in_flight = 0
+    logging.info(f"crawl finished: {stats.snapshot()}")
+    return stats
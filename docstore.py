@@ -0,0 +1,215 @@
+import os
+import mmap
+import zlib
+import struct
+import numpy as np
+from bs4 import BeautifulSoup
+from segment import _pack_strings
+from extract import FAST_PARSER, load_record
+from ii_tc import iter_documents
+
+
+# 文档存储文件格式（小端）:
+#   header: magic, version, num_docs, 以及各个section的(offset, length)
+#   doc_offsets/doc_blob: 按utf-8字节序排好的文档路径
+#   record_offsets/records: 与文档对齐的zlib压缩记录，解压后是 标题 + "\0" + 正文
+DOCSTORE = "docstore.bin"
+MAGIC = b"CDOC"
+VERSION = 1
+SECTIONS = ("doc_offsets", "doc_blob", "record_offsets", "records")
+HEADER = struct.Struct("<4sII" + "QQ" * len(SECTIONS))
+
+
+def docstore_path(save_path: str) -> str:
+    return os.path.join(save_path, DOCSTORE)
+
+
+def compress_record(title: str, content: str) -> bytes:
+    return zlib.compress(f"{title}\0{content}".encode("utf-8"))
+
+
+def document_title(document: str) -> str:
+    """文档的标题：优先读取爬虫保存的页面记录，没有记录时解析html，没有标题时返回空字符串"""
+    index_html_path = os.path.join(document, "index.html")
+    record = load_record(index_html_path)
+    if record is not None:
+        return record["title"] or ""
+    if not os.path.exists(index_html_path):
+        return ""
+    with open(index_html_path, "r", encoding="utf-8") as f:
+        soup = BeautifulSoup(f, FAST_PARSER)
+    title = soup.title.string if soup.title else None
+    return title.strip() if title else ""
+
+
+def write_docstore(file_path: str, records: dict) -> None:
+    """把压缩好的记录写成文档存储文件
+
+    Args:
+        file_path (str): 文件路径
+        records (dict): 文档 -> compress_record的结果
+    """
+    documents = sorted(records, key=lambda document: document.encode("utf-8"))
+    blobs = [records[document] for document in documents]
+    record_offsets = np.zeros(len(blobs) + 1, dtype="<u8")
+    np.cumsum([len(blob) for blob in blobs], out=record_offsets[1:])
+
+    doc_offsets, doc_blob = _pack_strings(documents)
+    sections = {
+        "doc_offsets": doc_offsets,
+        "doc_blob": doc_blob,
+        "record_offsets": record_offsets.tobytes(),
+        "records": b"".join(blobs),
+    }
+
+    layout = []
+    offset = HEADER.size
+    for name in SECTIONS:
+        offset += -offset % 8
+        layout.extend((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(documents), *layout))
+        for name, section_offset in zip(SECTIONS, layout[::2]):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, file_path)
+
+
+class DocStore:
+    """mmap方式只读打开的文档存储：每个文档的标题和正文压缩后存在一个文件里，
+    重排序和结果展示按文档路径二分查找，不需要为每个结果打开文件
+
+    Args:
+        file_path (str): 文档存储文件路径
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.num_docs, *layout = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a docstore file: {file_path}")
+        self._sections = {
+            name: (layout[2 * i], layout[2 * i + 1]) for i, name in enumerate(SECTIONS)
+        }
+        self.doc_offsets = self._array("doc_offsets")
+        self.record_offsets = self._array("record_offsets")
+        self._doc_blob = self._sections["doc_blob"][0]
+        self._records = self._sections["records"][0]
+
+    def _array(self, name: str) -> np.ndarray:
+        offset, length = self._sections[name]
+        return np.frombuffer(self._mmap, dtype="<u8", count=length // 8, offset=offset)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def __contains__(self, document: str) -> bool:
+        return self._doc_id(document) is not None
+
+    def _doc_name_bytes(self, doc_id: int) -> bytes:
+        start = self._doc_blob + int(self.doc_offsets[doc_id])
+        end = self._doc_blob + int(self.doc_offsets[doc_id + 1])
+        return self._mmap[start:end]
+
+    def _doc_id(self, document: str):
+        key = document.encode("utf-8")
+        low, high = 0, self.num_docs
+        while low < high:
+            middle = (low + high) // 2
+            current = self._doc_name_bytes(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def documents(self) -> list[str]:
+        return [self._doc_name_bytes(doc_id).decode("utf-8") for doc_id in range(self.num_docs)]
+
+    def raw(self, document: str):
+        """文档的压缩记录，不存在时返回None"""
+        doc_id = self._doc_id(document)
+        if doc_id is None:
+            return None
+        start = self._records + int(self.record_offsets[doc_id])
+        end = self._records + int(self.record_offsets[doc_id + 1])
+        return self._mmap[start:end]
+
+    def get(self, document: str):
+        """返回文档的(标题, 正文)，不存在时返回None"""
+        blob = self.raw(document)
+        if blob is None:
+            return None
+        title, content = zlib.decompress(blob).decode("utf-8").split("\0", 1)
+        return title, content
+
+
+class MultiDocStore:
+    """联合多个域名的文档存储，按文档路径所在的域名目录查找
+
+    Args:
+        stores (list[DocStore]): 各域名的文档存储
+    """
+
+    def __init__(self, stores: list[DocStore]):
+        self.stores = [
+            (os.path.dirname(store.file_path) + os.sep, store) for store in stores
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(store) for _, store in self.stores)
+
+    def get(self, document: str):
+        for save_path, store in self.stores:
+            if (document + os.sep).startswith(save_path):
+                result = store.get(document)
+                if result is not None:
+                    return result
+        return None
+
+
+def build_docstore(save_path: str, documents=None) -> int:
+    """构建域名的文档存储
+
+    Args:
+        save_path (str): 域名目录
+        documents (optional): 只重新读取这些文档（增量更新），其余文档沿用旧存储中的压缩记录；
+            None时读取全部文档. Defaults to None.
+
+    Returns:
+        int: 存储中的文档数
+    """
+    file_path = docstore_path(save_path)
+    records = {}
+    if documents is not None and os.path.exists(file_path):
+        old = DocStore(file_path)
+        documents = set(documents)
+        for document in old.documents():
+            if document not in documents:
+                records[document] = bytes(old.raw(document))
+    else:
+        documents = [document for document, _, _ in iter_documents(save_path)]
+
+    for document in documents:
+        index_content_path = os.path.join(document, "index_content.txt")
+        if not os.path.exists(index_content_path):
+            continue
+        with open(index_content_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        records[document] = compress_record(document_title(document), content)
+
+    write_docstore(file_path, records)
+    return len(records)
+
+
+def load_docstores(paths: list[str]) -> MultiDocStore:
+    """打开存在的文档存储；还没有构建完成的域名跳过，查询时回退到读文件"""
+    return MultiDocStore([DocStore(path) for path in paths if os.path.exists(path)])
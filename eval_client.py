@@ -8,9 +8,8 @@ sys.path.insert(0, parent_dir)
 import json
 import requests
 import getpass
-from utils import load_dict_json
 from urllib.parse import urljoin
-from eval_search_engine import evaluate
+from eval_search_engine import evaluate, evaluate_batch
 
 # 待填充，助教在调试完成后会公布使用的base_url
 base_url = "http://223.4.87.133:3389/"
@@ -56,12 +55,8 @@ def main():
     queries = login(idx, passwd)
     # print(queries)
 
-    tot_urls = []
-    
-    for index, query in enumerate(queries):
-        print(f"finish {index}..\n")
-        urls = evaluate(query)
-        tot_urls.append(urls)
+    # 所有query一起检索，重排序并行进行
+    tot_urls = evaluate_batch(queries)
 
     mode, mrr = send_ans(idx, passwd, tot_urls)
     print(f"MRR@20: [{mrr}], [{mode}] mode")
@@ -71,21 +66,20 @@ if __name__ == "__main__":
     
     # main()
     
-    tf_idf = load_dict_json("saved/history/http-ai-ruc-edu-cn-https-gsai-ruc-edu-cn-https-www-jiqizhixin-com/tf_idf.json")
-    
-    combined_ii = load_dict_json("saved/history/http-ai-ruc-edu-cn-https-gsai-ruc-edu-cn-https-www-jiqizhixin-com/combined_ii.json")
-    
     idx = input_idx()
     passwd = input_passwd()
     queries = login(idx, passwd)
     print(queries)
 
-    tot_urls = []
-    
-    for index, query in enumerate(queries):
-        print(f"finish {index}..\n")
-        urls = evaluate(query, tf_idf, combined_ii)
-        tot_urls.append(urls)
+    # 默认批量评测；--sequential逐个query调用main.main
+    if "--sequential" in sys.argv:
+        tot_urls = []
+        for index, query in enumerate(queries):
+            print(f"finish {index}..\n")
+            urls = evaluate(query)
+            tot_urls.append(urls)
+    else:
+        tot_urls = evaluate_batch(queries)
 
     mode, mrr = send_ans(idx, passwd, tot_urls)
     print(f"MRR@20: [{mrr}], [{mode}] mode")
\ No newline at end of file
@@ -5,9 +5,38 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
 sys.path.insert(0, parent_dir)
 
-from main import main
+from main import main, batch_search
 
-def evaluate(query: str, tf_idf, combined_ii) -> list:
+TARGET_URLS: set[str] = {
+    "https://gsai.ruc.edu.cn",
+    "http://ai.ruc.edu.cn",
+    "https://www.jiqizhixin.co4m",
+}
+
+TARGET_DOMAINS: set[str] = {
+    "https://gsai.ruc.edu.cn",
+    "http://ai.ruc.edu.cn",
+    "https://www.jiqizhixin.com",
+}
+
+
+def evaluate_batch(queries: list[str], workers: int = os.cpu_count() or 1) -> list[list]:
+    """一次评测一批query：共用同一个索引，一起打分，重排序分给workers个进程
+    参数：queries，查询列表；workers，重排序进程数
+    返回值：与queries对齐的url列表
+    """
+    return batch_search(
+        target_urls=TARGET_URLS,
+        target_domains=TARGET_DOMAINS,
+        root="saved",
+        stopwords_dir="stopwords-master",
+        queries=queries,
+        top_k=60,
+        workers=workers,
+    )
+
+
+def evaluate(query: str) -> list:
     """
     各位同学需要完成evaluate函数，通过调用之前自己的代码来实现搜索引擎的功能
     参数：query，字符串类型，它代表查询
@@ -37,9 +66,6 @@ def evaluate(query: str, tf_idf, combined_ii) -> list:
         stopwords_dir=stopwords_dir,
         query=query,
         top_k=60,
-        
-        tf_idf=tf_idf,
-        combined_ii=combined_ii,
     )
     
     return url_list
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import json
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+
+    FAST_PARSER = "lxml"
+except ImportError:
+    FAST_PARSER = "html.parser"
+
+
+HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+
+def extract_content(soup: BeautifulSoup) -> tuple[str, list[str]]:
+    """从soup中提取用于分词的文本：标题前加#，小标题两侧加#，段落原样，列表项前加"- "
+
+    Args:
+        soup (BeautifulSoup): 页面的soup对象
+
+    Returns:
+        tuple[str, list[str]]: 文本内容，小标题列表
+    """
+    content = []
+    headings = []
+
+    # 空标题或带嵌套标签的标题没有string，与page_record一样跳过
+    title = soup.title.string if soup.title else None
+    if title and title.strip():
+        content.append(f"#{title.strip()}")
+
+    for element in soup.find_all([*HEADINGS, "p", "li"]):
+        text = element.get_text(strip=True)
+        if element.name.startswith("h"):
+            content.append(f"#{text}#")
+            headings.append(text)
+
+        elif element.name == "p":
+            paragraph_text = "".join(
+                child.get_text(strip=True)
+                for child in element.find_all(string=True)
+            )
+            if paragraph_text:
+                content.append(paragraph_text)
+
+        elif element.name == "li":
+            content.append(f"- {text}")
+
+    return "\n\n".join(content), headings
+
+
+def page_record(soup: BeautifulSoup, url: str, links: set) -> dict:
+    """抓取时一次解析得到的页面记录，分词和结果展示不需要再解析html
+
+    Args:
+        soup (BeautifulSoup): 页面的soup对象
+        url (str): 页面url
+        links (set): 页面中的链接
+
+    Returns:
+        dict: {"url", "title", "headings", "text", "links"}
+    """
+    text, headings = extract_content(soup)
+    title = soup.title.string if soup.title else None
+    return {
+        "url": url,
+        "title": title.strip() if title else None,
+        "headings": headings,
+        "text": text,
+        "links": sorted(links),
+    }
+
+
+def record_path(file_path: str) -> str:
+    """html文件对应的记录文件，index.html -> index_record.json"""
+    return os.path.splitext(file_path)[0] + "_record.json"
+
+
+def save_record(record: dict, file_path: str) -> None:
+    tmp_path = record_path(file_path) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, record_path(file_path))
+
+
+def load_record(file_path: str):
+    """读取html文件对应的记录，不存在时返回None"""
+    try:
+        with open(record_path(file_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def remove_record(file_path: str) -> None:
+    """html被重新写入时删除旧记录，避免记录与html不一致"""
+    if os.path.exists(record_path(file_path)):
+        os.remove(record_path(file_path))
@@ -0,0 +1,237 @@
+import math
+import numpy as np
+from segment import Segment, decode_varints
+from lexicon import Lexicon
+from scoring import maxscore_top_k, batch_top_k
+
+
+def segment_term_stats(segment: Segment) -> tuple:
+    """解码一个词频段文件的全部倒排
+
+    Args:
+        segment (Segment): 词频段文件
+
+    Returns:
+        tuple: (词列表, df数组, 每条倒排的词编号, 文档编号, 词频)
+    """
+    terms = [segment.term(term_id) for term_id in range(segment.num_terms)]
+    dfs = segment.term_table["df"].astype(np.int64)
+    term_of_posting = np.repeat(np.arange(segment.num_terms), dfs)
+
+    # 整段一起解码，再按词把差分还原成文档编号
+    deltas = decode_varints(segment.postings_bytes)
+    cumulative = np.cumsum(deltas)
+    starts = segment.term_table["weights"].astype(np.int64)
+    base = np.zeros(len(deltas), dtype=np.int64)
+    nonempty = dfs > 0
+    base_values = cumulative[starts[nonempty]] - deltas[starts[nonempty]]
+    base[starts[nonempty]] = np.diff(base_values, prepend=0)
+    docs = cumulative - np.cumsum(base)
+
+    return terms, dfs, term_of_posting, docs, segment.weights.astype(np.float64)
+
+
+def segment_fields(segment: Segment) -> np.ndarray:
+    """与segment_term_stats的倒排对齐的字段词频，形状为(倒排数, 2)，段没有字段信息时全为0"""
+    if segment.fields is None:
+        return np.zeros((len(segment.weights), 2), dtype=np.int64)
+    return np.stack([segment.fields["title"], segment.fields["heading"]], axis=1).astype(np.int64)
+
+
+class FederatedIndex:
+    """查询时联合多个词频段文件（多个域名，或一个域名的多个段），不生成合并后的索引
+
+    全局df为各段df之和，文档总数为各段文档数之和，文档权重为
+    log(1 + tc) * log(N / (1 + df))。
+    文档范数依赖全局idf，在构造时对每个段做一次向量化计算。
+    被删除（墓碑标记）的文档不参与df、文档总数和打分，全局文档编号只分配给存活的文档。
+
+    Args:
+        segments (list[Segment]): 词频段文件
+        deleted (list, optional): 每个段中已删除的文档编号，None表示没有删除. Defaults to None.
+    """
+
+    def __init__(self, segments: list[Segment], deleted: list = None):
+        self.segments = segments
+        if deleted is None:
+            deleted = [None] * len(segments)
+
+        # 段内文档编号 -> 全局文档编号，已删除的为-1
+        self.id_maps = []
+        self.live_docs = []
+        self.offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        for i, (segment, removed) in enumerate(zip(segments, deleted)):
+            live = np.ones(len(segment), dtype=bool)
+            if removed is not None and len(removed):
+                live[np.asarray(removed, dtype=np.int64)] = False
+            live_docs = np.flatnonzero(live)
+            id_map = np.full(len(segment), -1, dtype=np.int64)
+            id_map[live_docs] = self.offsets[i] + np.arange(len(live_docs))
+            self.id_maps.append(id_map)
+            self.live_docs.append(live_docs)
+            self.offsets[i + 1] = self.offsets[i] + len(live_docs)
+        self.total_documents = int(self.offsets[-1])
+
+        stats = [segment_term_stats(segment) for segment in segments]
+
+        # 每个段中每个词的存活文档数
+        self.dfs = []
+        for id_map, (terms, _, term_of_posting, docs, _) in zip(self.id_maps, stats):
+            alive = id_map[docs] >= 0
+            self.dfs.append(np.bincount(term_of_posting[alive], minlength=len(terms)))
+
+        # 用词表把各段的词对齐到同一个全局编号上，求出全局df
+        lexicon = Lexicon()
+        global_ids = [
+            np.fromiter((lexicon.add(term) for term in terms), dtype=np.int64, count=len(terms))
+            for terms, *_ in stats
+        ]
+        global_dfs = np.zeros(len(lexicon))
+        for term_ids, dfs in zip(global_ids, self.dfs):
+            # 段内的词互不相同
+            global_dfs[term_ids] += dfs
+
+        self.norms = []
+        self.bounds = []
+        for segment, id_map, term_ids, (terms, dfs, term_of_posting, docs, tcs) in zip(
+            segments, self.id_maps, global_ids, stats
+        ):
+            alive = id_map[docs] >= 0
+            with np.errstate(divide="ignore"):
+                idf = np.log(self.total_documents / (1 + global_dfs[term_ids]))
+            weights = np.where(alive, np.log1p(tcs) * idf[term_of_posting], 0.0)
+            norms = np.sqrt(np.bincount(docs, weights=weights**2, minlength=len(segment)))
+            self.norms.append(norms)
+
+            low = np.zeros(len(terms))
+            high = np.zeros(len(terms))
+            nonempty = dfs > 0
+            if nonempty.any():
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    normalized = np.where(
+                        alive & (norms[docs] > 0), weights / norms[docs], 0.0
+                    )
+                # 已删除文档不参与上下界
+                normalized[~alive] = np.nan
+                term_starts = segment.term_table["weights"].astype(np.int64)[nonempty]
+                low[nonempty] = np.nan_to_num(np.fmin.reduceat(normalized, term_starts))
+                high[nonempty] = np.nan_to_num(np.fmax.reduceat(normalized, term_starts))
+            self.bounds.append((low, high))
+
+    def __len__(self) -> int:
+        return self.total_documents
+
+    @property
+    def nbytes(self) -> int:
+        """内存占用：映射的段文件，加上构造时为每个段计算的数组（编号映射、df、范数、上下界）"""
+        arrays = [self.offsets, *self.id_maps, *self.live_docs, *self.dfs, *self.norms]
+        arrays.extend(bound for bounds in self.bounds for bound in bounds)
+        return sum(segment.nbytes for segment in self.segments) + sum(
+            array.nbytes for array in arrays
+        )
+
+    def _segment_dfs(self, term: str):
+        for segment, dfs in zip(self.segments, self.dfs):
+            term_id = segment.term_id(term)
+            yield term_id, (0 if term_id is None else int(dfs[term_id]))
+
+    def document_frequency(self, term: str) -> int:
+        return sum(df for _, df in self._segment_dfs(term))
+
+    def idf(self, term: str) -> float:
+        return math.log(self.total_documents / (1 + self.document_frequency(term)))
+
+    def __contains__(self, term: str) -> bool:
+        return self.document_frequency(term) > 0
+
+    def __getitem__(self, term: str) -> np.ndarray:
+        """与倒排索引字典兼容：返回包含该词的全局文档编号"""
+        docs = []
+        for segment, id_map in zip(self.segments, self.id_maps):
+            postings = segment.raw_postings(term)
+            if postings is not None:
+                global_docs = id_map[postings[0]]
+                docs.append(global_docs[global_docs >= 0])
+        docs = np.concatenate(docs) if docs else np.empty(0, dtype=np.int64)
+        if not len(docs):
+            raise KeyError(term)
+        return docs
+
+    def doc_name(self, doc_id: int) -> str:
+        i = int(np.searchsorted(self.offsets, doc_id, side="right")) - 1
+        return self.segments[i].doc_name(int(self.live_docs[i][doc_id - int(self.offsets[i])]))
+
+    def postings(self, term: str):
+        """合并各段的倒排，返回(全局文档编号, 除以文档范数后的tf-idf)"""
+        idf = None
+        all_docs = []
+        all_weights = []
+        for segment, norms, id_map in zip(self.segments, self.norms, self.id_maps):
+            postings = segment.raw_postings(term)
+            if postings is None:
+                continue
+            docs, tcs = postings
+            global_docs = id_map[docs]
+            alive = global_docs >= 0
+            if not alive.any():
+                continue
+            if idf is None:
+                idf = self.idf(term)
+            docs, tcs = docs[alive], tcs[alive]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weights = np.where(
+                    norms[docs] > 0, np.log1p(tcs.astype(np.float64)) * idf / norms[docs], 0.0
+                )
+            all_docs.append(global_docs[alive])
+            all_weights.append(weights)
+        if not all_docs:
+            return None
+        return np.concatenate(all_docs), np.concatenate(all_weights)
+
+    def field_postings(self, term: str):
+        """合并各段的倒排，返回(全局文档编号, 词频, 字段词频)，字段词频的每一行是(标题, 小标题)出现次数；
+        没有字段信息的段按0处理，词不存在时返回None"""
+        all_docs = []
+        all_tcs = []
+        all_fields = []
+        for segment, id_map in zip(self.segments, self.id_maps):
+            postings = segment.raw_postings(term)
+            if postings is None:
+                continue
+            docs, tcs = postings
+            global_docs = id_map[docs]
+            alive = global_docs >= 0
+            if not alive.any():
+                continue
+            fields = segment.raw_fields(term)
+            if fields is None:
+                fields = np.zeros((len(docs), 2), dtype=np.int64)
+            else:
+                fields = np.stack([fields["title"], fields["heading"]], axis=1).astype(np.int64)
+            all_docs.append(global_docs[alive])
+            all_tcs.append(np.rint(tcs[alive]).astype(np.int64))
+            all_fields.append(fields[alive])
+        if not all_docs:
+            return None
+        return np.concatenate(all_docs), np.concatenate(all_tcs), np.concatenate(all_fields)
+
+    def weight_bounds(self, term: str) -> tuple[float, float]:
+        low = high = None
+        for (term_id, df), (lows, highs) in zip(self._segment_dfs(term), self.bounds):
+            if not df:
+                continue
+            low = lows[term_id] if low is None else min(low, lows[term_id])
+            high = highs[term_id] if high is None else max(high, highs[term_id])
+        # 放宽一点，抵消两次计算之间的浮点误差
+        slack = 1e-9 * max(abs(low), abs(high), 1.0)
+        return float(low) - slack, float(high) + slack
+
+    def top_k(self, query_tf_idf: dict, top_k: int, method: str = "maxscore") -> list[int]:
+        """返回与query余弦相似度最高的top_k个全局文档编号（只支持maxscore），用doc_name解析路径"""
+        if method != "maxscore":
+            raise ValueError(f"Unsupported scoring method for federated index: {method}")
+        return maxscore_top_k(self, query_tf_idf, top_k)
+
+    def batch_top_k(self, query_tf_idfs: list[dict], top_k: int) -> list[list[int]]:
+        """一批query一起打分，见scoring.batch_top_k"""
+        return batch_top_k(self, query_tf_idfs, top_k)
@@ -0,0 +1,272 @@
+import os
+import math
+import hashlib
+import threading
+import numpy as np
+from utils import load_state
+
+
+def url_fingerprint(url: str) -> int:
+    """url的64位指纹"""
+    return int.from_bytes(
+        hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class BloomFilter:
+    """布隆过滤器，放在指纹集合前面，绝大多数没见过的url不用再查有序数组
+
+    Args:
+        capacity (int): 预计元素个数
+        error_rate (float, optional): 期望误判率. Defaults to 0.01.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, fingerprint: int):
+        # 用指纹的高低32位做双重哈希
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, fingerprint: int) -> None:
+        for position in self._positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(fingerprint)
+        )
+
+
+class SeenSet:
+    """由64位url指纹组成的紧凑集合：有序uint64数组 + 最近加入的小集合，
+    小集合满了再合并进数组；持久化为只追加的指纹文件，checkpoint只写新增部分
+
+    Args:
+        file_path (str, optional): 指纹文件路径，None表示只在内存中. Defaults to None.
+        bloom_capacity (int, optional): 布隆过滤器容量，0表示不使用. Defaults to 0.
+        merge_threshold (int, optional): 小集合合并进有序数组的阈值. Defaults to 65536.
+    """
+
+    def __init__(
+        self, file_path: str = None, bloom_capacity: int = 0, merge_threshold: int = 65536
+    ):
+        self.file_path = file_path
+        self.merge_threshold = merge_threshold
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+        self._lock = threading.Lock()
+        self._recent = set()
+        self._unsaved = []
+
+        if file_path and os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                data = f.read()
+            # 丢掉中断时写了一半的指纹
+            data = data[: len(data) - len(data) % 8]
+            self._sorted = np.unique(np.frombuffer(data, dtype="<u8").astype(np.uint64))
+        else:
+            self._sorted = np.empty(0, dtype=np.uint64)
+
+        if self.bloom is not None:
+            for fingerprint in self._sorted.tolist():
+                self.bloom.add(fingerprint)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sorted) + len(self._recent)
+
+    def _contains(self, fingerprint: int) -> bool:
+        if self.bloom is not None and fingerprint not in self.bloom:
+            return False
+        if fingerprint in self._recent:
+            return True
+        i = np.searchsorted(self._sorted, np.uint64(fingerprint))
+        return i < len(self._sorted) and int(self._sorted[i]) == fingerprint
+
+    def __contains__(self, url: str) -> bool:
+        fingerprint = url_fingerprint(url)
+        with self._lock:
+            return self._contains(fingerprint)
+
+    def add(self, url: str) -> bool:
+        """加入url，返回它之前是否没见过"""
+        fingerprint = url_fingerprint(url)
+        with self._lock:
+            if self._contains(fingerprint):
+                return False
+            self._recent.add(fingerprint)
+            self._unsaved.append(fingerprint)
+            if self.bloom is not None:
+                self.bloom.add(fingerprint)
+            if len(self._recent) >= self.merge_threshold:
+                self._merge()
+            return True
+
+    def _merge(self) -> None:
+        recent = np.fromiter(self._recent, dtype=np.uint64, count=len(self._recent))
+        self._sorted = np.union1d(self._sorted, recent)
+        self._recent = set()
+
+    def checkpoint(self) -> None:
+        """把上次checkpoint之后新增的指纹追加到文件"""
+        if not self.file_path:
+            return
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+        if unsaved:
+            with open(self.file_path, "ab") as f:
+                f.write(np.asarray(unsaved, dtype="<u8").tobytes())
+
+
+class DiskFrontier:
+    """磁盘上的待爬队列：只追加的日志文件，每行"depth\\turl"；
+    cursor文件记录第一个还没处理完的条目的位置，checkpoint只需flush日志并写cursor
+
+    Args:
+        file_path (str): 日志文件路径，cursor保存在 file_path + ".cursor"
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.cursor_path = file_path + ".cursor"
+        self._lock = threading.Lock()
+        self._in_flight = set()
+
+        cursor = 0
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path, "r") as f:
+                cursor = int(f.read().strip() or 0)
+
+        self._writer = open(file_path, "ab")
+        self._drop_partial_line()
+        self._written = self._writer.tell()
+        self._flushed = self._written
+        self._reader = open(file_path, "rb")
+        self._read_pos = min(cursor, self._written)
+        self._reader.seek(self._read_pos)
+
+        # 启动时数一遍cursor之后还剩多少条
+        self._pending = sum(1 for line in self._reader if line.endswith(b"\n"))
+        self._reader.seek(self._read_pos)
+
+    def _drop_partial_line(self) -> None:
+        """去掉中断时写了一半的最后一行"""
+        size = self._writer.tell()
+        if size == 0:
+            return
+        with open(self.file_path, "rb") as f:
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        last_newline = tail.rfind(b"\n")
+        if last_newline < 0 and size > len(tail):
+            return
+        self._writer.truncate(size - len(tail) + last_newline + 1)
+        self._writer.seek(0, os.SEEK_END)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def push(self, url: str, depth: int) -> None:
+        line = f"{depth}\t{url}\n".encode("utf-8")
+        with self._lock:
+            self._writer.write(line)
+            self._written += len(line)
+            self._pending += 1
+
+    def pop(self):
+        """取出下一条，返回(url, depth, offset)，队列为空时返回None；
+        处理完成后需要调用done(offset)"""
+        with self._lock:
+            if self._pending == 0:
+                return None
+            if self._read_pos >= self._flushed:
+                self._writer.flush()
+                self._flushed = self._written
+            offset = self._read_pos
+            line = self._reader.readline()
+            self._read_pos += len(line)
+            self._pending -= 1
+            self._in_flight.add(offset)
+
+        depth, url = line.decode("utf-8").rstrip("\n").split("\t", 1)
+        return url, int(depth), offset
+
+    def done(self, offset: int) -> None:
+        with self._lock:
+            self._in_flight.discard(offset)
+
+    def checkpoint(self) -> None:
+        """flush日志并原子地写入cursor；全部处理完时截断日志"""
+        with self._lock:
+            if self._pending == 0 and not self._in_flight:
+                self._writer.truncate(0)
+                self._writer.seek(0)
+                self._written = self._flushed = self._read_pos = 0
+                self._reader.seek(0)
+            else:
+                self._writer.flush()
+                self._flushed = self._written
+            cursor = min(self._in_flight, default=self._read_pos)
+
+            tmp_path = self.cursor_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(cursor))
+            os.replace(tmp_path, self.cursor_path)
+
+    def close(self) -> None:
+        self.checkpoint()
+        self._writer.close()
+        self._reader.close()
+
+
+def open_crawl_state(
+    save_path: str, url: str, bloom_capacity: int = 0, restart: bool = False
+) -> tuple[SeenSet, DiskFrontier]:
+    """打开域名目录下的爬虫状态：url指纹集合crawler_seen.fp和待爬队列crawler_frontier.log；
+    只有旧版crawler_state.pkl时先迁移过来
+
+    Args:
+        save_path (str): 域名目录
+        url (str): 起点url，队列为空时从它开始
+        bloom_capacity (int, optional): 布隆过滤器容量，0表示不使用. Defaults to 0.
+        restart (bool, optional): 上次已经爬完（队列为空）时清空指纹集合，从起点重新爬. Defaults to False.
+
+    Returns:
+        tuple[SeenSet, DiskFrontier]: 指纹集合，待爬队列
+    """
+    seen_path = os.path.join(save_path, "crawler_seen.fp")
+    frontier_path = os.path.join(save_path, "crawler_frontier.log")
+    migrate = not os.path.exists(seen_path) and os.path.exists(
+        os.path.join(save_path, "crawler_state.pkl")
+    )
+
+    frontier = DiskFrontier(frontier_path)
+    if restart and len(frontier) == 0 and os.path.exists(seen_path):
+        os.remove(seen_path)
+    seen = SeenSet(seen_path, bloom_capacity=bloom_capacity)
+
+    if migrate:
+        fp_links, queue = load_state(save_path)
+        for link in fp_links:
+            seen.add(link)
+        for link, depth in queue:
+            # 旧队列中可能有重复的url，只在第一次出现时入队
+            if seen.add(link):
+                frontier.push(link, depth)
+
+    if len(frontier) == 0 and seen.add(url):
+        frontier.push(url, 0)
+
+    # 先写队列再写指纹：中途中断最多导致重复入队，不会丢url
+    frontier.checkpoint()
+    seen.checkpoint()
+    return seen, frontier
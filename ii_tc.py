@@ -1,14 +1,23 @@
 import os
-from collections import defaultdict
-from utils import save_dict_json, read_segmented_and_content
-
-
-def build_term_counts(index_segmented: str, index_content: str) -> dict:
+import time
+from collections import Counter
+from utils import read_segmented_and_content
+from extract import load_record
+from lexicon import TermTable
+from segment_store import SegmentStore
+from aho_corasick import Automaton
+
+
+def build_term_counts(
+    index_segmented: str, index_content: str, count_mode: str = "substring"
+) -> dict:
     """计算制定文档的tf(s)，如果index_segmented是str，则转为list，否则直接使用（这里认为index_segmented一定是分词表）
 
     Args:
         index_segmented (str): 分词表
         index_content (str): 待统计内容
+        count_mode (str, optional): "substring"统计词在原文中不重叠出现的次数（与str.count一致，
+            用Aho-Corasick自动机一次扫描原文）；"token"统计词在分词表中出现的次数. Defaults to "substring".
 
     Returns:
         dict: 分词后的term-frequency字典
@@ -16,60 +25,155 @@ def build_term_counts(index_segmented: str, index_content: str) -> dict:
     if isinstance(index_segmented, str):
         index_segmented = index_segmented.split("/")
 
+    if count_mode == "token":
+        return dict(Counter(index_segmented))
+    if count_mode != "substring":
+        raise ValueError(f"Unknown count_mode: {count_mode}")
+
+    automaton = Automaton(index_segmented)
+    counts = automaton.count(index_content)
+
     term_count = {}
     for term in index_segmented:
-        term_count[term] = index_content.count(term)
+        if term:
+            term_count[term] = counts[automaton.pattern_id(term)]
+        else:
+            # 与str.count("")保持一致
+            term_count[term] = len(index_content) + 1
 
     return term_count
 
 
-def build_ii_tc(save_path: str) -> tuple:
-    """构建倒排索引(inverted_index)和词频表(term_counts)
+def document_record(document_id: str):
+    """文档（html所在目录）的页面记录，爬虫没有保存记录时返回None"""
+    return load_record(os.path.join(document_id, "index.html"))
+
+
+def split_fields(index_content: str, record: dict = None) -> tuple[list[str], list[str]]:
+    """拆出标题和小标题：有页面记录时直接使用记录中的title和headings；
+    否则按extract_content的标记从文本中猜测：以#开头的段落是标题，两侧都是#的段落是小标题，
+    其余段落是正文
 
     Args:
-        save_path (str): 目标根目录
+        index_content (str): 文本内容
+        record (dict, optional): 页面记录(extract.page_record). Defaults to None.
 
     Returns:
-        tuple: inverted_index, term_counts
+        tuple[list[str], list[str]]: 标题列表，小标题列表（均已去掉#）
     """
-    inverted_index = defaultdict(set)
-    term_counts = {}
+    if record is not None:
+        return ([record["title"]] if record.get("title") else []), list(record["headings"])
 
-    for root, _, files in os.walk(save_path):
-        for file in files:
-            document_id = root
+    titles = []
+    headings = []
+    for paragraph in index_content.split("\n\n"):
+        if not paragraph.startswith("#"):
+            continue
+        if len(paragraph) >= 2 and paragraph.endswith("#"):
+            headings.append(paragraph[1:-1])
+        else:
+            titles.append(paragraph[1:])
+    return titles, headings
 
-            index_segmented_path = os.path.join(root, "index_segmented.txt")
-            index_content_path = os.path.join(root, "index_content.txt")
 
-            if not os.path.exists(index_segmented_path) or not os.path.exists:
-                continue
+def build_field_counts(index_segmented, index_content: str, record: dict = None) -> dict:
+    """统计每个词在标题和小标题中的出现次数（与substring方式的词频一致，不重叠出现的次数），
+    查询时的小标题加分直接读取这些字段词频，不需要扫描原文
 
-            index_segmented, index_content = read_segmented_and_content(
-                index_segmented_path, index_content_path
-            )
+    Args:
+        index_segmented (str | list): 分词表
+        index_content (str): 文本内容
+        record (dict, optional): 页面记录，给出时标题和小标题取自记录，见split_fields. Defaults to None.
 
-            for term in index_segmented:
-                inverted_index[term].add(document_id)
+    Returns:
+        dict: {词: (标题中出现次数, 小标题中出现次数)}，只包含至少出现一次的词
+    """
+    if isinstance(index_segmented, str):
+        index_segmented = index_segmented.split("/")
 
-            tc = build_term_counts(index_segmented, index_content)
+    titles, headings = split_fields(index_content, record)
+    if not titles and not headings:
+        return {}
+    # 用\0连接，词不会跨字段匹配
+    title_text = "\0".join(titles)
+    heading_text = "\0".join(headings)
 
-            term_counts[document_id] = {}
-            term_counts[document_id]["tc"] = tc
+    field_counts = {}
+    for term in set(index_segmented):
+        if not term:
+            continue
+        counts = (title_text.count(term), heading_text.count(term))
+        if counts[0] or counts[1]:
+            field_counts[term] = counts
+    return field_counts
 
-    return inverted_index, term_counts
 
+def iter_documents(save_path: str):
+    """遍历目录，每个同时包含index_segmented.txt和index_content.txt的目录是一个文档
+
+    Args:
+        save_path (str): 目标根目录
+
+    Yields:
+        tuple: (document_id, index_segmented_path, index_content_path)
+    """
+    for root, _, files in os.walk(save_path):
+        if "index_segmented.txt" in files and "index_content.txt" in files:
+            yield (
+                root,
+                os.path.join(root, "index_segmented.txt"),
+                os.path.join(root, "index_content.txt"),
+            )
 
-def ii_tc_build_and_save(save_path: str) -> None:
-    """构建并保存ii_tc
+
+def build_ii_tc(save_path: str, count_mode: str = "substring") -> TermTable:
+    """构建词频表(term_counts)，每个文档只读取和统计一次；文档和词都编号存储，
+    同时记录每个词在标题和小标题中的出现次数（字段词频），
+    倒排索引由词频表转置得到（TermTable.inverted_index）
 
     Args:
         save_path (str): 目标根目录
+        count_mode (str, optional): 词频统计方式，见build_term_counts. Defaults to "substring".
+
+    Returns:
+        TermTable: 词频表
     """
+    term_counts = TermTable()
+    total_postings = 0
+    start = time.perf_counter()
+
+    for document_id, index_segmented_path, index_content_path in iter_documents(
+        save_path
+    ):
+        index_segmented, index_content = read_segmented_and_content(
+            index_segmented_path, index_content_path
+        )
+
+        tc = build_term_counts(index_segmented, index_content, count_mode)
+        fields = build_field_counts(
+            index_segmented, index_content, document_record(document_id)
+        )
+        term_counts.add(document_id, tc, fields)
+        total_postings += len(tc)
+
+    elapsed = time.perf_counter() - start
+    documents_per_second = len(term_counts) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"ii-tc: {len(term_counts)} documents, {total_postings} postings "
+        f"in {elapsed:.2f}s ({documents_per_second:.1f} docs/s)"
+    )
+
+    return term_counts
+
+
+def ii_tc_build_and_save(save_path: str, count_mode: str = "substring") -> None:
+    """构建ii_tc并重建域名的段式索引(segments/)；查询和增量更新只使用段式索引，
+    不再写出整份的inverted_index.json和term_counts.json
 
-    inverted_index, term_counts = build_ii_tc(save_path)
+    Args:
+        save_path (str): 目标根目录
+        count_mode (str, optional): 词频统计方式，见build_term_counts. Defaults to "substring".
+    """
 
-    inverted_index_path = os.path.join(save_path, "inverted_index.json")
-    save_dict_json(inverted_index, inverted_index_path)
-    term_counts_path = os.path.join(save_path, "term_counts.json")
-    save_dict_json(term_counts, term_counts_path)
\ No newline at end of file
+    term_counts = build_ii_tc(save_path, count_mode)
+    SegmentStore.for_domain(save_path).reset(term_counts)
@@ -0,0 +1,185 @@
+import os
+import time
+import hashlib
+from utils import save_dict_json, load_dict_json, read_segmented_and_content
+from tokenizer import html_files, page_text, segment_text, write_tokens
+from ii_tc import build_term_counts, build_field_counts, document_record
+from segment_store import open_domain_store
+from lexicon import TermTable
+from docstore import build_docstore
+from page_cache import load_changed_pages, clear_changed_pages
+
+
+DOC_MANIFEST = "doc_manifest.json"
+
+
+def file_digest(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_doc_manifest(save_path: str) -> dict:
+    """读取域名目录下每个html文件的(mtime, size, sha1)记录"""
+    manifest_path = os.path.join(save_path, DOC_MANIFEST)
+    if os.path.exists(manifest_path):
+        return load_dict_json(manifest_path)
+    return {}
+
+
+def scan_changes(
+    save_path: str, manifest: dict, candidates: set = None
+) -> tuple[list, list, dict]:
+    """对比manifest找出新增、修改和删除的html文件；mtime和大小都没变的文件不读内容，
+    变了的再比较内容哈希，内容相同只更新记录
+
+    Args:
+        save_path (str): 域名目录
+        manifest (dict): 上次构建时的记录
+        candidates (set, optional): 爬虫记录的内容有变化的html；给出时不在其中、
+            manifest里已有的文件直接视为没变，不再stat. Defaults to None.
+
+    Returns:
+        tuple[list, list, dict]: 新增或修改的html路径，删除的html路径，新的manifest
+    """
+    changed = []
+    new_manifest = {}
+
+    for file_path in html_files(save_path):
+        key = os.path.relpath(file_path, save_path)
+        entry = manifest.get(key)
+        if candidates is not None and entry is not None and file_path not in candidates:
+            new_manifest[key] = entry
+            continue
+
+        stat = os.stat(file_path)
+        if (
+            entry is not None
+            and entry["mtime"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            new_manifest[key] = entry
+            continue
+
+        digest = file_digest(file_path)
+        new_manifest[key] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": digest,
+        }
+        if entry is None or entry["sha1"] != digest:
+            changed.append(file_path)
+
+    deleted = [
+        os.path.join(save_path, key) for key in manifest if key not in new_manifest
+    ]
+    return changed, deleted, new_manifest
+
+
+def record_doc_manifest(save_path: str) -> None:
+    """全量构建之后记录当前所有html文件的状态，作为之后增量更新的基准"""
+    _, _, manifest = scan_changes(save_path, load_doc_manifest(save_path))
+    save_dict_json(manifest, os.path.join(save_path, DOC_MANIFEST))
+    # 全量构建已经包含了爬虫记录的所有变化
+    clear_changed_pages(save_path)
+
+
+def document_of(file_path: str, save_path: str) -> str:
+    """html文件对应的ii-tc文档id，与os.walk(save_path)给出的目录写法一致"""
+    document_id = os.path.dirname(file_path)
+    if os.path.normpath(document_id) == os.path.normpath(save_path):
+        return save_path
+    return document_id
+
+
+def tokenize_changes(stopwords_dir: str, changed: list, deleted: list) -> None:
+    """只对新增或修改的html分词，删除已删除html对应的分词结果"""
+    for file_path in changed:
+        text = page_text(file_path)
+        write_tokens(file_path, text, segment_text(text, stopwords_dir))
+
+    for file_path in deleted:
+        base = os.path.splitext(file_path)[0]
+        for suffix in ("_content.txt", "_segmented.txt", "_record.json"):
+            if os.path.exists(base + suffix):
+                os.remove(base + suffix)
+
+
+def update_segments(
+    save_path: str, documents: set, count_mode: str = "substring"
+) -> tuple[int, int]:
+    """把受影响文档写成段式索引中的一个新段，文档的旧版本和已删除的文档打上墓碑，
+    不重写已有的索引文件
+
+    Args:
+        save_path (str): 域名目录
+        documents (set): 受影响的文档（目录）
+        count_mode (str, optional): 词频统计方式，见build_term_counts. Defaults to "substring".
+
+    Returns:
+        tuple[int, int]: 更新（含新增）的文档数，删除的文档数
+    """
+    store = open_domain_store(save_path)
+    term_counts = TermTable()
+    gone = []
+    for document_id in sorted(documents):
+        index_segmented_path = os.path.join(document_id, "index_segmented.txt")
+        index_content_path = os.path.join(document_id, "index_content.txt")
+        if not (
+            os.path.exists(index_segmented_path) and os.path.exists(index_content_path)
+        ):
+            gone.append(document_id)
+            continue
+
+        index_segmented, index_content = read_segmented_and_content(
+            index_segmented_path, index_content_path
+        )
+        term_counts.add(
+            document_id,
+            build_term_counts(index_segmented, index_content, count_mode),
+            build_field_counts(index_segmented, index_content, document_record(document_id)),
+        )
+
+    store.add(term_counts)
+    removed = store.delete(gone)
+    while store.maybe_merge():
+        pass
+    return len(term_counts), removed
+
+
+def incremental_update(stopwords_dir: str, save_path: str) -> bool:
+    """增量更新一个已经完整构建过的域名：只重新分词和统计变化的网页，写成段式索引中的一个新段；
+    idf和文档范数在查询时由各段联合计算，不需要重写tf-idf。
+    爬虫留下了变化清单(changed_pages.txt)时只检查清单中的网页和新出现、消失的网页
+
+    Args:
+        stopwords_dir (str): 停用词目录
+        save_path (str): 域名目录
+
+    Returns:
+        bool: 是否有网页发生变化
+    """
+    start = time.perf_counter()
+    manifest = load_doc_manifest(save_path)
+    changed_pages = load_changed_pages(save_path)
+    changed, deleted, new_manifest = scan_changes(save_path, manifest, changed_pages)
+
+    if changed or deleted:
+        tokenize_changes(stopwords_dir, changed, deleted)
+        # ii-tc中的文档是html所在的目录
+        documents = {
+            document_of(file_path, save_path) for file_path in changed + deleted
+        }
+        updated, removed = update_segments(save_path, documents)
+        build_docstore(save_path, documents)
+        print(
+            f"incremental: {len(changed)} changed, {len(deleted)} deleted html, "
+            f"{updated} documents updated, {removed} removed "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    if new_manifest != manifest:
+        save_dict_json(new_manifest, os.path.join(save_path, DOC_MANIFEST))
+    if changed_pages:
+        clear_changed_pages(save_path)
+
+    return bool(changed or deleted)
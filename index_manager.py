@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from segment import Segment
+from federation import FederatedIndex
+from segment_store import MANIFEST, load_snapshot
+from docstore import MultiDocStore, load_docstores
+
+
+DEFAULT_MEMORY_BUDGET = 2 * 1024**3  # 2GB
+
+
+def file_signature(paths: list[str]) -> tuple:
+    """根据文件的mtime和大小生成签名，用来判断索引文件是否被重建
+
+    Args:
+        paths (list[str]): 索引文件路径
+
+    Returns:
+        tuple: 文件签名，文件不存在时对应项为None
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def load_federated(paths: list[str]) -> FederatedIndex:
+    """联合多个索引：段式索引的清单(manifest.json)展开为其中存活的段和墓碑，其余路径是单个段文件"""
+    segments = []
+    deleted = []
+    for path in paths:
+        if os.path.basename(path) == MANIFEST:
+            segment_paths, tombstones = load_snapshot(path)
+            segments.extend(Segment(segment_path) for segment_path in segment_paths)
+            deleted.extend(tombstones)
+        else:
+            segments.append(Segment(path))
+            deleted.append(None)
+    return FederatedIndex(segments, deleted)
+
+
+class IndexManager:
+    """常驻内存的索引管理器：每个domain组合(domains_key)的索引只加载一次，
+    按LRU策略在内存预算内淘汰，索引文件被重建后自动重新加载
+
+    Args:
+        memory_budget (int): 内存预算（字节）；索引提供nbytes时按nbytes计算占用（联合索引包括
+            清单中的段文件和构造时计算的数组），否则按依赖文件的大小估算
+        check_interval (float): 两次检查索引文件签名之间的最小间隔（秒）
+    """
+
+    def __init__(
+        self, memory_budget: int = DEFAULT_MEMORY_BUDGET, check_interval: float = 1.0
+    ):
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(entry["cost"] for entry in self._entries.values())
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, paths: list[str], loader):
+        """取出key对应的索引，不在内存中或文件已被重建时调用loader重新加载
+
+        Args:
+            key: 索引的键，一般是domains_key
+            paths (list[str]): 索引依赖的文件，用于计算签名与内存占用
+            loader (callable): loader(paths) 返回加载好的索引
+
+        Returns:
+            loader返回的索引对象
+        """
+        entry = self._lookup(key, paths)
+        if entry is not None:
+            return entry["value"]
+
+        with self._key_lock(key):
+            # 等锁期间可能已经被其他线程加载
+            entry = self._lookup(key, paths)
+            if entry is not None:
+                return entry["value"]
+
+            signature = file_signature(paths)
+            value = loader(paths)
+            # 联合索引依赖的只是几百字节的清单文件，占用以索引自己统计的nbytes为准
+            cost = getattr(value, "nbytes", None)
+            if cost is None:
+                cost = sum(size or 0 for _, _, size in signature)
+            self._store(key, value, signature, cost)
+            return value
+
+    def get_federated(self, domains_key: str, segment_paths: list[str]) -> FederatedIndex:
+        """取出domain组合的联合索引，由各域名的段式索引在查询时联合得到；
+        清单文件被原子替换（新段、墓碑或合并）后自动重新加载
+
+        Args:
+            domains_key (str): domain组合的键
+            segment_paths (list[str]): 各域名段式索引的清单，或单个段文件
+
+        Returns:
+            FederatedIndex: 联合索引
+        """
+        return self.get(
+            domains_key,
+            segment_paths,
+            load_federated,
+        )
+
+    def get_docstore(self, domains_key: str, docstore_paths: list[str]) -> MultiDocStore:
+        """取出domain组合的文档存储（mmap），文档存储被重建后自动重新加载
+
+        Args:
+            domains_key (str): domain组合的键
+            docstore_paths (list[str]): 各域名的文档存储文件
+
+        Returns:
+            MultiDocStore: 联合的文档存储
+        """
+        return self.get(("docstore", domains_key), docstore_paths, load_docstores)
+
+    def invalidate(self, key=None) -> None:
+        """移除指定key的索引，key为None时清空全部"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key, paths: list[str]):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            now = time.monotonic()
+            if now - entry["checked"] < self.check_interval:
+                self._entries.move_to_end(key)
+                return entry
+
+        # stat放在锁外，避免阻塞其他请求
+        if file_signature(paths) != entry["signature"]:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return None
+            entry["checked"] = now
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, signature: tuple, cost: int) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "value": value,
+                "signature": signature,
+                "cost": cost,
+                "checked": time.monotonic(),
+            }
+            # 淘汰最久未使用的索引，至少保留刚加载的一个
+            total = sum(entry["cost"] for entry in self._entries.values())
+            while total > self.memory_budget and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                total -= evicted["cost"]
+
+
+index_manager = IndexManager(
+    memory_budget=int(
+        os.environ.get("CSEARCH_INDEX_MEMORY_BUDGET", DEFAULT_MEMORY_BUDGET)
+    )
+)
@@ -0,0 +1,245 @@
+import os
+import json
+import numpy as np
+
+
+class Lexicon:
+    """字符串 <-> 连续整数编号的双向表，编号按加入顺序分配；
+    用作文档编号表（文档路径）和词表，每个字符串只保存一份
+
+    用法与 {字符串: 编号} 字典相同（get、[]、in、len），编号 -> 字符串用strings
+    """
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self._ids = {}
+        for string in strings:
+            self.add(string)
+
+    def add(self, string: str) -> int:
+        """返回字符串的编号，不存在时分配一个新编号"""
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self._ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def get(self, string: str, default=None):
+        return self._ids.get(string, default)
+
+    def __getitem__(self, string: str) -> int:
+        return self._ids[string]
+
+    def __contains__(self, string: str) -> bool:
+        return string in self._ids
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+
+class TermTable:
+    """文档 x 词 的稀疏表（词频或tf-idf）：文档编号表 + 词表 + 每个文档一行(词编号数组, 取值数组)
+
+    流水线各阶段内部只使用整数编号，文档路径和词只在两个表中各存一份；
+    保存的json同样是 {"docs": 文档路径, "terms": 词, key: 每个文档的[词编号, 取值]}。
+    词频表还可以带字段词频：每个文档中每个词在标题和小标题中的出现次数
+
+    Args:
+        docs (Lexicon, optional): 文档编号表. Defaults to None.
+        terms (Lexicon, optional): 词表，多个表可以共用. Defaults to None.
+    """
+
+    def __init__(self, docs: Lexicon = None, terms: Lexicon = None):
+        self.docs = docs if docs is not None else Lexicon()
+        self.terms = terms if terms is not None else Lexicon()
+        self.rows = []
+        # 文档编号 -> 与该行词编号对齐的(标题, 小标题)出现次数，没有字段信息的文档不保存
+        self.fields = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, document: str) -> bool:
+        return document in self.docs
+
+    def add(self, document: str, values: dict, fields: dict = None) -> int:
+        """加入一个文档的 {词: 取值}，文档已存在时替换这一行
+
+        Args:
+            document (str): 文档
+            values (dict): {词: 取值}
+            fields (dict, optional): {词: (标题中出现次数, 小标题中出现次数)}，只需包含出现在标题或小标题中的词. Defaults to None.
+
+        Returns:
+            int: 文档编号
+        """
+        term_ids = np.fromiter(
+            (self.terms.add(term) for term in values), dtype=np.int32, count=len(values)
+        )
+        row_fields = None
+        if fields:
+            row_fields = np.array([fields.get(term, (0, 0)) for term in values], dtype=np.int64)
+        return self.add_row(document, term_ids, np.asarray(list(values.values())), row_fields)
+
+    def add_row(
+        self, document: str, term_ids: np.ndarray, values: np.ndarray, fields: np.ndarray = None
+    ) -> int:
+        """加入一个已经编号好的行（词编号是本表词表中的编号），fields是对齐的(标题, 小标题)出现次数"""
+        doc_id = self.docs.get(document)
+        if doc_id is None:
+            doc_id = self.docs.add(document)
+            self.rows.append((term_ids, values))
+        else:
+            self.rows[doc_id] = (term_ids, values)
+        if fields is not None and fields.any():
+            self.fields[doc_id] = fields
+        else:
+            self.fields.pop(doc_id, None)
+        return doc_id
+
+    def row_fields(self, doc_id: int) -> np.ndarray:
+        """与行对齐的(标题, 小标题)出现次数，没有字段信息时全为0"""
+        fields = self.fields.get(doc_id)
+        if fields is None:
+            return np.zeros((len(self.rows[doc_id][0]), 2), dtype=np.int64)
+        return fields
+
+    def get(self, document: str) -> dict:
+        """文档的 {词: 取值}，只在需要字符串的地方使用"""
+        term_ids, values = self.rows[self.docs[document]]
+        return {
+            self.terms.strings[term_id]: value
+            for term_id, value in zip(term_ids.tolist(), values.tolist())
+        }
+
+    def document_frequencies(self) -> np.ndarray:
+        """每个词编号出现在多少个文档中"""
+        if not self.rows:
+            return np.zeros(len(self.terms), dtype=np.int64)
+        term_ids = np.concatenate([term_ids for term_ids, _ in self.rows])
+        return np.bincount(term_ids, minlength=len(self.terms))
+
+    def _flatten(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lengths = np.fromiter(
+            (len(term_ids) for term_ids, _ in self.rows), dtype=np.int64, count=len(self.rows)
+        )
+        docs = np.repeat(np.arange(len(self.rows), dtype=np.int64), lengths)
+        if self.rows:
+            term_ids = np.concatenate([term_ids for term_ids, _ in self.rows]).astype(np.int64)
+            values = np.concatenate([values for _, values in self.rows])
+        else:
+            term_ids = np.empty(0, dtype=np.int64)
+            values = np.empty(0)
+        return docs, term_ids, values
+
+    def postings(self) -> tuple[list[str], dict]:
+        """转置成倒排表，供write_segment使用
+
+        Returns:
+            tuple[list[str], dict]: 文档列表，term -> (文档编号数组, 取值数组)，
+                有字段信息时为 (文档编号数组, 取值数组, 字段词频)
+        """
+        docs, term_ids, values = self._flatten()
+        order = np.argsort(term_ids, kind="stable")
+        docs, term_ids, values = docs[order], term_ids[order], values[order]
+        present, starts = np.unique(term_ids, return_index=True)
+        ends = np.append(starts[1:], len(term_ids))
+        spans = zip(present.tolist(), starts.tolist(), ends.tolist())
+        if not self.fields:
+            postings = {
+                self.terms.strings[term_id]: (docs[start:end], values[start:end])
+                for term_id, start, end in spans
+            }
+            return list(self.docs.strings), postings
+
+        fields = np.concatenate(
+            [self.row_fields(doc_id) for doc_id in range(len(self.rows))]
+        )[order]
+        postings = {
+            self.terms.strings[term_id]: (
+                docs[start:end], values[start:end], fields[start:end]
+            )
+            for term_id, start, end in spans
+        }
+        return list(self.docs.strings), postings
+
+    def inverted_index(self) -> list[list[int]]:
+        """每个词编号对应的文档编号列表（升序）"""
+        if not len(self.terms):
+            return []
+        docs, term_ids, _ = self._flatten()
+        order = np.argsort(term_ids, kind="stable")
+        boundaries = np.cumsum(np.bincount(term_ids, minlength=len(self.terms)))[:-1]
+        return [part.tolist() for part in np.split(docs[order], boundaries)]
+
+    @classmethod
+    def from_dict(cls, table: dict, key: str) -> "TermTable":
+        """由 {文档: {key: {词: 取值}}} 形式的字典（旧格式的term_counts/tf_idf）构建"""
+        term_table = cls()
+        for document, doc in table.items():
+            term_table.add(document, doc[key])
+        return term_table
+
+    def to_dict(self, key: str) -> dict:
+        return {document: {key: self.get(document)} for document in self.docs}
+
+    def save(self, file_path: str, key: str) -> None:
+        """保存为按编号存储的紧凑json"""
+        data = {
+            "docs": self.docs.strings,
+            "terms": self.terms.strings,
+            key: [[term_ids.tolist(), values.tolist()] for term_ids, values in self.rows],
+        }
+        if self.fields:
+            # 只保存出现在标题或小标题中的词：[行内位置, 标题, 小标题]
+            data["fields"] = {
+                str(doc_id): [
+                    [int(position), int(title), int(heading)]
+                    for position, (title, heading) in enumerate(fields.tolist())
+                    if title or heading
+                ]
+                for doc_id, fields in self.fields.items()
+            }
+        _dump_json(data, file_path)
+
+    def save_inverted_index(self, file_path: str) -> None:
+        """保存按编号存储的倒排索引：每个词编号的文档编号列表"""
+        data = {
+            "docs": self.docs.strings,
+            "terms": self.terms.strings,
+            "postings": self.inverted_index(),
+        }
+        _dump_json(data, file_path)
+
+    @classmethod
+    def load(cls, file_path: str, key: str) -> "TermTable":
+        """读取save保存的表；也兼容按文档路径和词存储的旧格式"""
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data.get("docs"), list) or not isinstance(data.get("terms"), list):
+            return cls.from_dict(data, key)
+
+        term_table = cls(Lexicon(data["docs"]), Lexicon(data["terms"]))
+        term_table.rows = [
+            (np.asarray(term_ids, dtype=np.int32), np.asarray(values))
+            for term_ids, values in data[key]
+        ]
+        for doc_id, entries in data.get("fields", {}).items():
+            doc_id = int(doc_id)
+            fields = np.zeros((len(term_table.rows[doc_id][0]), 2), dtype=np.int64)
+            for position, title, heading in entries:
+                fields[position] = (title, heading)
+            term_table.fields[doc_id] = fields
+        return term_table
+
+
+def _dump_json(data: dict, file_path: str) -> None:
+    # 不缩进，编号列表占用的空间远小于重复的路径和词；先写临时文件再替换
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, file_path)
@@ -1,22 +1,48 @@
 import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from slugify import slugify
 
 from crawler import links_scraper_bfs_parallel
 from tokenizer import token4search
 from ii_tc import ii_tc_build_and_save
-from tf_idf import tf_idf_build_and_save, combine_tf_idf
-from query import query_request, query_booster
+from query import (
+    query_request,
+    query_booster,
+    field_booster,
+    batch_query_request,
+    _init_rerank_worker,
+    _rerank_chunk,
+)
+from incremental import incremental_update, record_doc_manifest
+from pipeline import build_one_domain_streaming
+from segment_store import domain_manifest_path, open_domain_store
+from docstore import MultiDocStore, build_docstore, docstore_path
 
-from utils import url_to_path, load_dict_json
+from utils import url_to_path
+from index_manager import index_manager as default_index_manager
 from build import (
     check_build_status,
     update_build_status,
-    reset_build_status,
+    bump_generation,
 )
-from history import load_history, update_history
 
 
-def build_one_domain(url: str, domain: str, root: str, stopwords_dir: str) -> None:
+# backend_main和batch_search支持的重排序方式
+BONUS_MODES = ("window", "field")
+
+
+def build_one_domain(
+    url: str,
+    domain: str,
+    root: str,
+    stopwords_dir: str,
+    tokenize_workers: int = os.cpu_count() or 1,
+    crawl_engine: str = "threads",
+    recrawl: bool = False,
+    extract: bool = False,
+) -> None:
     """build一个域名下的所有信息
 
     Args:
@@ -24,65 +50,142 @@ def build_one_domain(url: str, domain: str, root: str, stopwords_dir: str) -> No
         domain (str): 想要的域名
         root (str): 保存地址根目录
         stopwords_dir (str): 停用词目录
-        query (str): 查询字符串
+        tokenize_workers (int, optional): 分词进程数. Defaults to os.cpu_count().
+        crawl_engine (str, optional): "threads"使用线程池爬虫，"async"使用asyncio爬虫（需要aiohttp）. Defaults to "threads".
+        recrawl (bool, optional): 已经爬完的域名用条件请求重新爬一遍，只有变化的网页进入增量构建. Defaults to False.
+        extract (bool, optional): 爬虫单次解析并保存页面记录，分词阶段不再解析html；
+            对不规范的html提取的正文可能与不开启时不同（见crawler.store_page）. Defaults to False.
     """
     save_path = url_to_path(url=domain, save_path=root)
 
     # ----------------------------------- crawl ---------------------------------- #
 
-    links_scraper_bfs_parallel(
-        url=url, domain=domain, save_path=save_path, max_depth=32, max_workers=6
-    )
+    if crawl_engine == "async":
+        from async_crawler import links_scraper_async_run
+
+        links_scraper_async_run(
+            url=url,
+            domain=domain,
+            save_path=save_path,
+            max_depth=32,
+            recrawl=recrawl,
+            extract=extract,
+        )
+    else:
+        links_scraper_bfs_parallel(
+            url=url,
+            domain=domain,
+            save_path=save_path,
+            max_depth=32,
+            max_workers=6,
+            recrawl=recrawl,
+            extract=extract,
+        )
 
     # --------------------------------- tokenize --------------------------------- #
 
+    full_build = False
+
     # init_build_status(root, domain, "tokenize")
     if check_build_status(root, domain, "tokenize"):
-        token4search(stopwords_dir, save_path)
+        token4search(stopwords_dir, save_path, workers=tokenize_workers)
+        record_doc_manifest(save_path)
         update_build_status(root, domain, "tokenize")
+        full_build = True
 
     # ----------------------------------- ii-tc ---------------------------------- #
 
     # init_build_status(root, domain, "ii-tc")
     if check_build_status(root, domain, "ii-tc"):
         ii_tc_build_and_save(save_path)
+        # 标题和正文压缩进一个文件，重排序和结果展示不再逐个打开文件
+        build_docstore(save_path)
         update_build_status(root, domain, "ii-tc")
+        full_build = True
 
-    # ---------------------------------- tf-idf ---------------------------------- #
-    
-    # init_build_status(root, domain, "tf-idf")
-    if check_build_status(root, domain, "tf-idf"):
-        tf_idf_build_and_save(save_path)
-        update_build_status(root, domain, "tf-idf")
-        
+    # ------------------------------- incremental -------------------------------- #
 
-def build_domains(
-    target_urls: set[str],
-    target_domains: set[str],
-    root: str,
-    dict_path: str,
-    stopwords_dir: str,
-) -> None:
+    # 各阶段都已完整构建过时，只处理重新爬取后新增、修改或删除的网页；
+    # idf在查询时由各段联合计算，没有需要重建的阶段，只增加索引版本号
+    if not full_build and incremental_update(stopwords_dir, save_path):
+        bump_generation(root, domain)
 
-    for domain in target_domains:
-        build_one_domain(
-            url=domain, domain=domain, root=root, stopwords_dir=stopwords_dir
-        )
 
-    tc_list = []
-    ii_list = []
+def domain_segment_path(domain: str, root: str) -> str:
+    """域名段式索引的清单路径"""
+    return domain_manifest_path(url_to_path(domain, root))
+
 
-    for domain in target_domains:
-        tc_list.append(
-            load_dict_json(os.path.join(url_to_path(domain, root), "term_counts.json"))
+def domain_docstore(target_domains: set[str], root: str, index_manager=None) -> MultiDocStore:
+    """取出domain组合的文档存储（常驻内存，重建后自动重新加载）"""
+    if index_manager is None:
+        index_manager = default_index_manager
+    domains_key = slugify(str(sorted(target_domains)))
+    paths = [docstore_path(url_to_path(domain, root)) for domain in sorted(target_domains)]
+    return index_manager.get_docstore(domains_key, paths)
+
+
+_streaming_builds = {}
+_streaming_lock = threading.Lock()
+
+
+def start_streaming_build(domain: str, root: str, stopwords_dir: str) -> None:
+    """在后台线程中流水线构建域名，同一域名同时只有一个构建"""
+    with _streaming_lock:
+        thread = _streaming_builds.get(domain)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=build_one_domain_streaming,
+            kwargs={
+                "url": domain,
+                "domain": domain,
+                "root": root,
+                "stopwords_dir": stopwords_dir,
+            },
+            daemon=True,
         )
-        ii_list.append(
-            load_dict_json(
-                os.path.join(url_to_path(domain, root), "inverted_index.json")
+        _streaming_builds[domain] = thread
+        thread.start()
+
+
+def ensure_domains_built(
+    target_domains: set[str], root: str, stopwords_dir: str, streaming: bool = False
+) -> list[str]:
+    """确保每个域名都已完成构建并有段式索引
+
+    Args:
+        target_domains (set[str]): 想要的域名
+        root (str): 保存地址根目录
+        stopwords_dir (str): 停用词目录
+        streaming (bool, optional): 未构建的域名在后台流水线构建，不等待构建完成，
+            先返回已提交的段. Defaults to False.
+
+    Returns:
+        list[str]: 按域名排序的段式索引清单路径
+    """
+    segment_paths = []
+    for domain in sorted(target_domains):
+        if check_build_status(root, domain, "ii-tc"):
+            if streaming:
+                start_streaming_build(domain, root, stopwords_dir)
+                # 流水线刚启动时可能还没有清单
+                if os.path.exists(domain_segment_path(domain, root)):
+                    segment_paths.append(domain_segment_path(domain, root))
+                continue
+            build_one_domain(
+                url=domain, domain=domain, root=root, stopwords_dir=stopwords_dir
             )
-        )
 
-    combine_tf_idf(tc_list, ii_list, tf_idf_save_path=dict_path)
+        segment_path = domain_segment_path(domain, root)
+        if not os.path.exists(segment_path):
+            # 在段式索引之前构建的域名，从term_counts.json导入
+            open_domain_store(url_to_path(domain, root))
+        if not os.path.exists(docstore_path(url_to_path(domain, root))):
+            build_docstore(url_to_path(domain, root))
+        segment_paths.append(segment_path)
+
+    return segment_paths
 
 
 def backend_main(
@@ -92,35 +195,51 @@ def backend_main(
     stopwords_dir: str,
     query: str,
     top_k: int,
+    index_manager=None,
+    streaming: bool = False,
+    bonus_mode: str = "window",
 ) -> list[str]:
+    """查询目标域名，返回(文档路径, url)列表
+
+    bonus_mode为"window"时按原文中分词是否靠近#标记重排序top_k个结果（读取文档存储）；
+    为"field"时按索引时记录的标题/小标题字段词频对包含query分词的全部文档重排序，不读取正文
+    """
+    if bonus_mode not in BONUS_MODES:
+        raise ValueError(f"Unknown bonus_mode: {bonus_mode}")
+    if index_manager is None:
+        index_manager = default_index_manager
+
     domains_key = slugify(str(sorted(target_domains)))
-    history_path = os.path.join(root, "history")
-    history_file_path = os.path.join(history_path, "history.json")
-
-    skip = True
-    if domains_key in load_history(history_file_path):
-        skip = False
-        
-    history = update_history(history_path, target_domains)
-    dict_path = history[domains_key]["dict_path"]
-    
-    if skip:
-        build_domains(target_urls, target_domains, root, dict_path, stopwords_dir)
-    
-    tf_idf = load_dict_json(os.path.join(dict_path, "tf_idf.json"))
-    combined_ii = load_dict_json(os.path.join(dict_path, "combined_ii.json"))
-    
+
+    # 每个域名只保留自己的词频段文件，查询时联合，不再为domain组合生成合并索引
+    # 流水线构建中的域名每次查询都取最新提交的段
+    if streaming or domains_key not in index_manager:
+        segment_paths = ensure_domains_built(
+            target_domains, root, stopwords_dir, streaming=streaming
+        )
+    else:
+        segment_paths = [domain_segment_path(domain, root) for domain in sorted(target_domains)]
+
+    federated_index = index_manager.get_federated(domains_key, segment_paths)
+
     top_k_docs, query_segs = query_request(
         query=query,
         stopwords_dir=stopwords_dir,
-        dict_path=dict_path,
+        dict_path=None,
         root=root,
         top_k=top_k,
-        tf_idf_dict=tf_idf,
-        inverted_index=combined_ii,
+        tf_idf_dict=None,
+        inverted_index=federated_index,
+        doc_matrix=federated_index,
     )
 
-    top_k_docs = query_booster(top_k_docs, query, query_segs)
+    if bonus_mode == "field":
+        top_k_docs = field_booster(federated_index, top_k_docs, query, query_segs)
+    else:
+        # 检索阶段只使用文档编号，在这里才解析为路径
+        top_k_docs = [federated_index.doc_name(doc_id) for doc_id in top_k_docs]
+        docstore = domain_docstore(target_domains, root, index_manager)
+        top_k_docs = query_booster(top_k_docs, query, query_segs, docstore)
     
     top_k_docs = [
         (doc, os.path.relpath(doc, root).replace("_", "://", 1)) for doc in top_k_docs
@@ -129,50 +248,105 @@ def backend_main(
     return top_k_docs
 
 
-def main(
+def batch_search(
     target_urls: set[str],
     target_domains: set[str],
     root: str,
     stopwords_dir: str,
-    query: str,
+    queries: list[str],
     top_k: int,
-    tf_idf,
-    combined_ii,
-) -> None:
-    
+    workers: int = os.cpu_count() or 1,
+    index_manager=None,
+    bonus_mode: str = "window",
+) -> list[list[str]]:
+    """批量查询：一批query共用同一个联合索引，一起分词、一次矩阵-矩阵乘法打分，
+    重排序分给进程池（每个子进程mmap打开文档存储）；用于离线评测
+
+    Args:
+        target_urls (set[str]): 爬虫起点url
+        target_domains (set[str]): 想要的域名
+        root (str): 保存地址根目录
+        stopwords_dir (str): 停用词目录
+        queries (list[str]): 待查询query
+        top_k (int): 每个query重排序前的检索数量
+        workers (int, optional): 重排序进程数，1时在当前进程中重排序. Defaults to os.cpu_count().
+        index_manager (IndexManager, optional): 索引管理器. Defaults to None.
+        bonus_mode (str, optional): 重排序方式，见backend_main. Defaults to "window".
+
+    Returns:
+        list[list[str]]: 每个query的结果url
+    """
+    if bonus_mode not in BONUS_MODES:
+        raise ValueError(f"Unknown bonus_mode: {bonus_mode}")
+    if index_manager is None:
+        index_manager = default_index_manager
+
     domains_key = slugify(str(sorted(target_domains)))
-    history_path = os.path.join(root, "history")
-    history_file_path = os.path.join(history_path, "history.json")
+    segment_paths = ensure_domains_built(target_domains, root, stopwords_dir)
+    federated_index = index_manager.get_federated(domains_key, segment_paths)
+
+    start = time.perf_counter()
+    all_top_k, all_segs = batch_query_request(queries, stopwords_dir, federated_index, top_k)
+    scored = time.perf_counter()
+
+    if bonus_mode == "field":
+        all_results = [
+            field_booster(federated_index, top_k_docs, query, query_segs)
+            for top_k_docs, query, query_segs in zip(all_top_k, queries, all_segs)
+        ]
+    else:
+        items = [
+            ([federated_index.doc_name(doc_id) for doc_id in top_k_docs], query, query_segs)
+            for top_k_docs, query, query_segs in zip(all_top_k, queries, all_segs)
+        ]
+        paths = [docstore_path(url_to_path(domain, root)) for domain in sorted(target_domains)]
+        workers = max(1, min(workers, len(items)))
+        if workers == 1:
+            docstore = domain_docstore(target_domains, root, index_manager)
+            all_results = [query_booster(*item, docstore) for item in items]
+        else:
+            chunksize = -(-len(items) // (4 * workers))
+            chunks = [items[i : i + chunksize] for i in range(0, len(items), chunksize)]
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_rerank_worker,
+                initargs=(paths,),
+            ) as executor:
+                all_results = [
+                    results for chunk in executor.map(_rerank_chunk, chunks) for results in chunk
+                ]
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"batch search: {len(queries)} queries, scoring {scored - start:.2f}s, "
+        f"total {elapsed:.2f}s ({len(queries) / elapsed if elapsed > 0 else 0.0:.1f} queries/s)"
+    )
 
-    skip = True
-    if domains_key in load_history(history_file_path).keys():
-        skip = False
+    return [
+        [os.path.relpath(doc, root).replace("_", "://", 1) for doc in results]
+        for results in all_results
+    ]
 
-    history = update_history(history_path, target_domains)
-    dict_path = history[domains_key]["dict_path"]
 
-    if skip:
-        build_domains(target_urls, target_domains, root, dict_path, stopwords_dir)
-        tf_idf = load_dict_json(os.path.join(dict_path, "tf_idf.json"))
-        combined_ii = load_dict_json(os.path.join(dict_path, "combined_ii.json"))
-    
-    top_k_docs, query_segs = query_request(
-        query=query,
-        stopwords_dir=stopwords_dir,
-        dict_path=dict_path,
+def main(
+    target_urls: set[str],
+    target_domains: set[str],
+    root: str,
+    stopwords_dir: str,
+    query: str,
+    top_k: int,
+) -> list[str]:
+    """逐个query查询（评测用），与backend_main一样在查询时联合各域名的段式索引，返回结果url"""
+    top_k_docs = backend_main(
+        target_urls=target_urls,
+        target_domains=target_domains,
         root=root,
+        stopwords_dir=stopwords_dir,
+        query=query,
         top_k=top_k,
-        tf_idf_dict=tf_idf,
-        inverted_index=combined_ii,
     )
 
-    top_k_docs = query_booster(top_k_docs, query, query_segs)
-    
-    top_k_docs = [
-        os.path.relpath(doc, root).replace("_", "://", 1) for doc in top_k_docs
-    ]
-    
-    return top_k_docs
+    return [url for _, url in top_k_docs]
 
 
 if __name__ == "__main__":
@@ -195,9 +369,6 @@ if __name__ == "__main__":
 
     query = "情感分析在各个维度和方面取得了显著的发展。该领域已从传统的粗粒度分析（如文档和句子级别分析）发展到细粒度分析"
 
-    tf_idf = None
-    combined_ii = None
-
     top_k_docs = main(
         target_urls=target_urls,
         target_domains=target_domains,
@@ -205,9 +376,6 @@ if __name__ == "__main__":
         stopwords_dir=stopwords_dir,
         query=query,
         top_k=60,
-        
-        tf_idf=tf_idf,
-        combined_ii=combined_ii,
     )
 
     for doc in top_k_docs:
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import threading
+
+
+PAGE_CACHE = "crawler_pages.jsonl"
+CHANGED_PAGES = "changed_pages.txt"
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+
+class PageCache:
+    """每个url上次抓取时的ETag、Last-Modified和内容哈希，用于重新爬取时的条件请求；
+    记录保存在只追加的crawler_pages.jsonl中，同一url以最后一行为准；
+    内容发生变化（重新写入磁盘）的网页追加到changed_pages.txt，供增量构建使用
+
+    Args:
+        save_path (str): 域名目录
+    """
+
+    def __init__(self, save_path: str):
+        self.save_path = save_path
+        self.file_path = os.path.join(save_path, PAGE_CACHE)
+        self.changes_path = os.path.join(save_path, CHANGED_PAGES)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._unsaved = []
+        self._changed = []
+
+        self._lines = 0
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断时写了一半的最后一行
+                        continue
+                    self._entries[entry.pop("url")] = entry
+                    self._lines += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, url: str):
+        """返回url的{"etag", "last_modified", "sha1"}，没有记录时返回None"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def record(self, url: str, etag: str, last_modified: str, sha1: str) -> None:
+        entry = {"etag": etag, "last_modified": last_modified, "sha1": sha1}
+        with self._lock:
+            if self._entries.get(url) == entry:
+                return
+            self._entries[url] = entry
+            self._unsaved.append(url)
+
+    def mark_changed(self, file_path: str) -> None:
+        """记录内容有变化、重新写入的html文件"""
+        with self._lock:
+            self._changed.append(os.path.relpath(file_path, self.save_path))
+
+    def checkpoint(self) -> None:
+        """追加上次checkpoint之后的新记录；重复记录过多时整体重写一次"""
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+            changed, self._changed = self._changed, []
+            lines = [
+                json.dumps({"url": url, **self._entries[url]}, ensure_ascii=False) + "\n"
+                for url in dict.fromkeys(unsaved)
+            ]
+            self._lines += len(lines)
+
+            if self._lines > 2 * len(self._entries) + 1024:
+                tmp_path = self.file_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for url, entry in self._entries.items():
+                        f.write(json.dumps({"url": url, **entry}, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.file_path)
+                self._lines = len(self._entries)
+            elif lines:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+
+        if changed:
+            with open(self.changes_path, "a", encoding="utf-8") as f:
+                f.writelines(path + "\n" for path in changed)
+
+
+def load_changed_pages(save_path: str):
+    """读取爬虫记录的内容有变化的html文件（完整路径）；从未记录过时返回None"""
+    changes_path = os.path.join(save_path, CHANGED_PAGES)
+    if not os.path.exists(changes_path):
+        return None
+    with open(changes_path, "r", encoding="utf-8") as f:
+        return {
+            os.path.join(save_path, line.rstrip("\n")) for line in f if line.endswith("\n")
+        }
+
+
+def clear_changed_pages(save_path: str) -> None:
+    """下游处理完变化的网页之后清空记录"""
+    changes_path = os.path.join(save_path, CHANGED_PAGES)
+    if os.path.exists(changes_path):
+        open(changes_path, "w").close()
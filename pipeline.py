@@ -0,0 +1,327 @@
+import os
+import time
+import queue
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from crawler import links_scraper_bfs_parallel
+from tokenizer import html_files, write_tokens, _init_tokenize_worker, _tokenize_chunk
+from ii_tc import build_term_counts, build_field_counts, document_record
+from incremental import document_of, record_doc_manifest
+from segment_store import SegmentStore
+from lexicon import TermTable
+from docstore import build_docstore
+from utils import url_to_path
+from build import update_build_status, bump_generation
+
+
+class StreamingIndex:
+    """流水线构建中的索引：分词后的文档先进入内存缓冲，定期作为一个新段提交到域名的段式索引，
+    查询时与已提交的段联合；后台线程按分层策略合并小段；内存中只保留尚未提交的文档
+
+    Args:
+        save_path (str): 域名目录
+        count_mode (str, optional): 词频统计方式，见build_term_counts. Defaults to "substring".
+        on_change (callable, optional): 查询可见的索引发生变化（重置、提交新段）后调用，
+            用来增加索引版本号，使查询结果缓存失效. Defaults to None.
+    """
+
+    def __init__(self, save_path: str, count_mode: str = "substring", on_change=None):
+        self.save_path = save_path
+        self.count_mode = count_mode
+        self.on_change = on_change
+        self.documents = set()
+        self.commits = 0
+        self._buffer = TermTable()
+        self._lock = threading.Lock()
+
+        # 上次中断的构建留下的段作废，已抓取的网页会重新进入流水线
+        self.store = SegmentStore.for_domain(save_path)
+        self.store.reset()
+        self._changed()
+        self.store.start_merger()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.documents)
+
+    def add(self, document_id: str, segmented_text: str, content: str) -> None:
+        index_segmented = segmented_text.strip().split("/")
+        tc = build_term_counts(index_segmented, content, self.count_mode)
+        fields = build_field_counts(index_segmented, content, document_record(document_id))
+        with self._lock:
+            self._buffer.add(document_id, tc, fields)
+            self.documents.add(document_id)
+
+    @property
+    def buffered(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def commit(self) -> None:
+        """把缓冲中的文档写成一个新段，之后的查询就能看到这些文档；
+        同一文档再次出现时旧版本会被打上墓碑"""
+        with self._lock:
+            buffer, self._buffer = self._buffer, TermTable()
+        if not len(buffer):
+            return
+        self.store.add(buffer)
+        self.commits += 1
+        self._changed()
+
+    def _changed(self) -> None:
+        # 后台合并不改变查询结果，不需要通知
+        if self.on_change is not None:
+            self.on_change()
+
+    def finish(self) -> None:
+        """提交剩余文档"""
+        self.commit()
+
+    def close(self) -> None:
+        self.store.stop_merger()
+
+
+def _run_stage(target, errors: list, failed: threading.Event, *args) -> None:
+    """运行一个流水线阶段；出错时记录异常并通知其他阶段停止"""
+    try:
+        target(failed, *args)
+    except Exception as e:
+        errors.append(e)
+        failed.set()
+
+
+def _put(stage_queue: queue.Queue, item, failed: threading.Event) -> None:
+    """阻塞地放入有界队列（反压）；其他阶段出错时不再等待"""
+    while True:
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if failed.is_set():
+                raise RuntimeError("streaming build stage failed")
+
+
+def _get(stage_queue: queue.Queue, failed: threading.Event, timeout: float = None):
+    """从队列取出一项，超时返回False；其他阶段出错时返回None（与结束标记相同）"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            if failed.is_set():
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+
+def _take_batch(
+    page_queue: queue.Queue, chunksize: int, block: bool, failed: threading.Event
+) -> tuple[list, bool]:
+    """从队列中取出最多chunksize个网页，返回(网页列表, 是否已取到结束标记)"""
+    batch = []
+    item = _get(page_queue, failed, timeout=None if block else 0.05)
+    if item is False:
+        return batch, False
+    while item is not None:
+        batch.append(item)
+        if len(batch) >= chunksize:
+            return batch, False
+        try:
+            item = page_queue.get_nowait()
+        except queue.Empty:
+            return batch, False
+    return batch, True
+
+
+def _tokenize_stage(
+    failed: threading.Event,
+    page_queue: queue.Queue,
+    doc_queue: queue.Queue,
+    stopwords_dir: str,
+    save_path: str,
+    workers: int,
+    chunksize: int,
+) -> None:
+    """分词阶段：网页攒成小批交给进程池分词，结果写盘后送入索引阶段"""
+
+    def emit(results: list[tuple]) -> None:
+        for file_path, text, segmented_text in results:
+            write_tokens(file_path, text, segmented_text)
+            _put(doc_queue, (document_of(file_path, save_path), segmented_text, text), failed)
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_tokenize_worker,
+            initargs=(stopwords_dir,),
+        )
+    else:
+        executor = None
+        _init_tokenize_worker(stopwords_dir)
+
+    pending = set()
+    finished = False
+    try:
+        while not finished or pending:
+            if not finished and len(pending) < 2 * workers:
+                batch, finished = _take_batch(page_queue, chunksize, not pending, failed)
+                if batch and executor is None:
+                    emit(_tokenize_chunk(batch))
+                elif batch:
+                    pending.add(executor.submit(_tokenize_chunk, batch))
+            if pending:
+                done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    _put(doc_queue, None, failed)
+
+
+def _index_stage(
+    failed: threading.Event,
+    doc_queue: queue.Queue,
+    streaming_index: StreamingIndex,
+    commit_interval: float,
+    commit_docs: int,
+) -> None:
+    """索引阶段：统计词频放进内存缓冲，每隔commit_interval秒或攒够commit_docs个文档提交一次"""
+    last_commit = time.monotonic()
+    while True:
+        item = _get(doc_queue, failed, timeout=commit_interval)
+        if item is None:
+            break
+        if item:
+            streaming_index.add(*item)
+
+        if streaming_index.buffered and (
+            streaming_index.buffered >= commit_docs
+            or time.monotonic() - last_commit >= commit_interval
+        ):
+            streaming_index.commit()
+            last_commit = time.monotonic()
+    streaming_index.commit()
+
+
+def build_one_domain_streaming(
+    url: str,
+    domain: str,
+    root: str,
+    stopwords_dir: str,
+    tokenize_workers: int = os.cpu_count() or 1,
+    queue_size: int = 256,
+    chunksize: int = 16,
+    commit_interval: float = 2.0,
+    commit_docs: int = 1000,
+    extract: bool = False,
+) -> None:
+    """流水线方式build一个域名：爬虫抓到的网页经过有界队列进入分词和词频统计，
+    索引每隔commit_interval秒向段式索引(save_path/segments/)提交一个新段，构建过程中查询就能看到新文档；
+    爬取、分词和统计同时进行，爬完之后提交剩余文档，不再重新遍历目录；idf在查询时由各段联合计算
+
+    只支持线程池爬虫；队列满时爬虫的调度会暂停（反压）。上次中断的构建会重新分词已抓取的网页
+
+    Args:
+        url (str): 爬虫起点url
+        domain (str): 想要的域名
+        root (str): 保存地址根目录
+        stopwords_dir (str): 停用词目录
+        tokenize_workers (int, optional): 分词进程数. Defaults to os.cpu_count().
+        queue_size (int, optional): 阶段之间队列的容量. Defaults to 256.
+        chunksize (int, optional): 每次交给分词进程的网页数. Defaults to 16.
+        commit_interval (float, optional): 提交小段文件的间隔（秒）. Defaults to 2.0.
+        commit_docs (int, optional): 缓冲文档数达到该值时立即提交. Defaults to 1000.
+        extract (bool, optional): 爬虫单次解析并保存页面记录. Defaults to False.
+    """
+    save_path = url_to_path(url=domain, save_path=root)
+    os.makedirs(save_path, exist_ok=True)
+    start = time.perf_counter()
+
+    streaming_index = StreamingIndex(save_path, on_change=partial(bump_generation, root, domain))
+    page_queue = queue.Queue(maxsize=queue_size)
+    doc_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    failed = threading.Event()
+    stages = [
+        threading.Thread(
+            target=_run_stage,
+            args=(
+                _tokenize_stage,
+                errors,
+                failed,
+                page_queue,
+                doc_queue,
+                stopwords_dir,
+                save_path,
+                tokenize_workers,
+                chunksize,
+            ),
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_run_stage,
+            args=(
+                _index_stage,
+                errors,
+                failed,
+                doc_queue,
+                streaming_index,
+                commit_interval,
+                commit_docs,
+            ),
+            daemon=True,
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+
+    queued = set()
+
+    def on_page(file_path: str) -> None:
+        if file_path not in queued:
+            queued.add(file_path)
+            _put(page_queue, file_path, failed)
+
+    try:
+        # 之前的运行已经抓取的网页
+        for file_path in html_files(save_path):
+            on_page(file_path)
+
+        links_scraper_bfs_parallel(
+            url=url,
+            domain=domain,
+            save_path=save_path,
+            max_depth=32,
+            max_workers=6,
+            extract=extract,
+            on_page=on_page,
+        )
+        _put(page_queue, None, failed)
+    except BaseException:
+        # 爬虫出错时通知其他阶段停止；后面的阶段出错导致爬虫被中断时抛出原始异常
+        failed.set()
+        if not errors:
+            raise
+    finally:
+        for stage in stages:
+            stage.join()
+        if failed.is_set():
+            streaming_index.close()
+    if errors:
+        raise errors[0]
+
+    streaming_index.finish()
+    streaming_index.close()
+    build_docstore(save_path)
+    record_doc_manifest(save_path)
+    update_build_status(root, domain, "tokenize")
+    update_build_status(root, domain, "ii-tc")
+
+    print(
+        f"streaming build: {len(streaming_index)} documents, "
+        f"{streaming_index.commits} commits, {len(streaming_index.store.segments)} segments "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
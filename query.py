@@ -1,16 +1,22 @@
 import math
 import os
+import re
+import numpy as np
+from bisect import bisect_left
 from ii_tc import build_term_counts
-from utils import load_dict_json, save_list_json, save_test_results, bonus
+from aho_corasick import Automaton
+from docstore import load_docstores
+from utils import load_dict_json, save_list_json, save_test_results
 from tokenizer import segment_text, extract_text, segment_query
 
 def compute_query_tf_idf(
-    inverted_index: dict, query_segs: str, query_tc: dict, total_documents: int
+    inverted_index, query_segs: str, query_tc: dict, total_documents: int
 ) -> dict:
     """计算query的tf-idf
 
     Args:
-        inverted_index (dict): 总的倒排索引
+        inverted_index: 提供df的索引，只用到 term in inverted_index 和 len(inverted_index[term])；
+            可以是倒排索引字典、Segment或FederatedIndex
         query_segs (str): query的分词
         query_tc (dict): query的词频字典
         total_documents (int): 总文档书，用来计算idf
@@ -44,12 +50,7 @@ def cosine_similarity(tf_idf: dict, query_tf_idf: dict) -> float:
     Returns:
         float: doc和query的余弦相似度
     """
-    all_terms = set(tf_idf.keys()).union(set(query_tf_idf.keys()))
-
-    tf_idf = {term: tf_idf.get(term, 0) for term in all_terms}
-    query_tf_idf = {term: query_tf_idf.get(term, 0) for term in all_terms}
-
-    dot_product = sum(tf_idf[key] * query_tf_idf[key] for key in tf_idf)
+    dot_product = sum(tf_idf.get(term, 0) * value for term, value in query_tf_idf.items())
 
     magnitude1 = math.sqrt(sum(value**2 for value in tf_idf.values()))
     magnitude2 = math.sqrt(sum(value**2 for value in query_tf_idf.values()))
@@ -61,7 +62,7 @@ def cosine_similarity(tf_idf: dict, query_tf_idf: dict) -> float:
 
 
 def top_k_similarity(tf_idf_dict: dict, query_tf_idf: dict, top_k: int) -> list:
-    """计算每个文档与查询的余弦相似度
+    """计算每个文档与查询的余弦相似度（逐文档的参考实现，线上查询走段/联合索引）
 
     Args:
         tf_idf_dict (dict): 所有文档的tf-idf
@@ -81,93 +82,265 @@ def top_k_similarity(tf_idf_dict: dict, query_tf_idf: dict, top_k: int) -> list:
 
 
 def query_request(
-    query: str, stopwords_dir: str, dict_path: str, root: str, top_k: int, tf_idf_dict: dict, inverted_index: dict
+    query: str, stopwords_dir: str, dict_path: str, root: str, top_k: int, tf_idf_dict: dict, inverted_index, doc_matrix=None, method: str = "maxscore"
 ) -> list[tuple]:
     """query请求pipeline
 
     Args:
         query (str): 待查询query
         stopwords_dir (str): 停用词目录
-        inverted_index (dict): 倒排索引
+        inverted_index: 提供df的索引，见compute_query_tf_idf；使用段/联合索引时与doc_matrix是同一个对象
         tf_idf_dict (dict): 所有文档的tf-idf
+        doc_matrix (Segment | FederatedIndex, optional): 段/联合索引，给出时用倒排打分. Defaults to None.
+        method (str, optional): 打分方式，段/联合索引只支持"maxscore"（只遍历query词的倒排表）. Defaults to "maxscore".
+
+    Returns:
+        list[tuple]: top_k文档，query的分词；给出doc_matrix时返回的是文档编号，
+            在展示结果时才用doc_matrix.doc_name解析为路径
     """
 
     query_segs = segment_query(query, stopwords_dir)
     query_tc = build_term_counts(query_segs, query)
 
-    total_documents = len(tf_idf_dict)
+    total_documents = len(doc_matrix) if doc_matrix is not None else len(tf_idf_dict)
 
     query_tf_idf = compute_query_tf_idf(
         inverted_index, query_segs, query_tc, total_documents
     )
 
-    top_k_docs = top_k_similarity(tf_idf_dict, query_tf_idf, top_k)
+    if doc_matrix is not None:
+        top_k_docs = doc_matrix.top_k(query_tf_idf, top_k, method=method)
+    else:
+        top_k_docs = top_k_similarity(tf_idf_dict, query_tf_idf, top_k)
 
     return top_k_docs, query_segs
 
-def calculate_score(text: str, query:str, query_segs: list) -> int:
-        """计算文本的匹配得分
+def batch_query_request(
+    queries: list[str], stopwords_dir: str, index, top_k: int
+) -> tuple[list[list[int]], list[str]]:
+    """一批query的检索：逐个分词（jieba词典和停用词只加载一次），共用同一个索引，
+    所有query的tf-idf一起与文档矩阵相乘（index.batch_top_k）
+
+    Args:
+        queries (list[str]): 待查询query
+        stopwords_dir (str): 停用词目录
+        index: Segment或FederatedIndex，同时用作倒排索引提供df
+        top_k (int): 每个query返回的数量
+
+    Returns:
+        tuple[list[list[int]], list[str]]: 每个query的top_k文档编号，每个query的分词
+    """
+    all_segs = [segment_query(query, stopwords_dir) for query in queries]
+    query_tf_idfs = [
+        compute_query_tf_idf(index, query_segs, build_term_counts(query_segs, query), len(index))
+        for query, query_segs in zip(queries, all_segs)
+    ]
+    return index.batch_top_k(query_tf_idfs, top_k), all_segs
+
+class QueryScorer:
+    """基于字符串匹配的重排序打分：所有query分词和完整query编进一个Aho-Corasick自动机，
+    每个文档只扫描一次，同时得到每个词的出现次数（与str.count一致）和是否靠近标题标记
+
+    靠近标题：某次出现（含重叠出现）向两侧各扩展radius个字符的窗口中，
+    有一个两侧（在窗口内）都不是target的target字符。窗口内部的这种字符就是原文中孤立的target，
+    预先用一次正则扫描找出；窗口两端只需要再看端点处的字符
+
+    Args:
+        query (str): 查询字符串
+        query_segs (list): 查询字符串分词结果
+        target (str, optional): 标题标记字符. Defaults to "#".
+        radius (int, optional): 窗口半径. Defaults to 7.
+    """
+
+    def __init__(self, query: str, query_segs: list, target: str = "#", radius: int = 7):
+        if len(target) != 1:
+            raise ValueError(f"target must be a single character: {target!r}")
+        self.query = query
+        self.query_segs = list(query_segs)
+        self.target = target
+        self.radius = radius
+        self.automaton = Automaton([*self.query_segs, query])
+        self._lengths = [len(pattern) for pattern in self.automaton.patterns]
+        escaped = re.escape(target)
+        self._isolated = re.compile(rf"(?<!{escaped}){escaped}(?!{escaped})")
+
+    def _near_target(self, text: str, isolated: list, start: int, end: int) -> bool:
+        """text[start:end]两侧各扩展radius后的窗口里是否有（窗口内）孤立的target"""
+        target = self.target
+        start = max(0, start - self.radius)
+        end = min(len(text), end + self.radius)
+        i = bisect_left(isolated, start)
+        if i < len(isolated) and isolated[i] < end:
+            return True
+        # 连续的target被窗口截断时，端点处的target在窗口内是孤立的
+        if text[start] == target and (start == end - 1 or text[start + 1] != target):
+            return True
+        return text[end - 1] == target and (end - 1 == start or text[end - 2] != target)
+
+    def score(self, text: str) -> int:
+        """计算文本的匹配得分，与逐词调用text.count和bonus的结果相同
 
         Args:
             text (str): 从结果中提取的文本
-            query_segs (list): 查询字符串分词结果
 
         Returns:
             int: 匹配得分
         """
+        num_patterns = len(self.automaton.patterns)
+        counts = [0] * num_patterns
+        next_free = [0] * num_patterns
+        near = [False] * num_patterns
+        isolated = [match.start() for match in self._isolated.finditer(text)]
+
+        for start, pattern_id in self.automaton.iter_matches(text):
+            end = start + self._lengths[pattern_id]
+            if start >= next_free[pattern_id]:
+                counts[pattern_id] += 1
+                next_free[pattern_id] = end
+            if not near[pattern_id]:
+                near[pattern_id] = self._near_target(text, isolated, start, end)
+
         score = 0
-        for seg in query_segs:
-            count = text.count(seg)
-            
-            if bonus(text, seg, "#", 7):
-                score += pow(len(seg), 3) * count
-                continue
-            
-            score += pow(len(seg), 2) * count
-
-        if bonus(text, query, "#", 7):
-            score += pow(len(query), 5) * text.count(query)
-        else:
-            score += pow(len(query), 4) * text.count(query)
-    
+        for seg in self.query_segs:
+            # 空串的长度为0，不影响得分
+            pattern_id = self.automaton.pattern_id(seg)
+            if pattern_id is not None:
+                score += pow(len(seg), 3 if near[pattern_id] else 2) * counts[pattern_id]
+
+        pattern_id = self.automaton.pattern_id(self.query)
+        if pattern_id is not None:
+            score += pow(len(self.query), 5 if near[pattern_id] else 4) * counts[pattern_id]
+
         return score
 
 
-def query_booster(results:list, query:str, query_segs:str)->list:
+def calculate_score(text: str, query:str, query_segs: list) -> int:
+        """计算文本的匹配得分（对多个文本打分时复用同一个QueryScorer）
+
+        Args:
+            text (str): 从结果中提取的文本
+            query_segs (list): 查询字符串分词结果
+
+        Returns:
+            int: 匹配得分
+        """
+        return QueryScorer(query, query_segs).score(text)
+
+
+def _booster_segs(query: str, query_segs) -> list:
+    """重排序使用的分词：按长度排序，与完整query相同的分词去掉（完整query单独计分）"""
+    if isinstance(query_segs, str):
+        query_segs = query_segs.split("/")
+
+    query_segs = sorted(query_segs, key=len)
+    if query_segs[-1] == query:
+        query_segs.pop()
+    return query_segs
+
+
+def _filter_results(scored_results) -> list:
+    """按得分排好序的(文档, 得分)中去掉路径含"index"的文档，最多保留21个"""
+    filtered_results = []
+
+    for result in scored_results:
+        if len(filtered_results) > 20:
+            break
+        if "index" in result[0]:
+            continue
+        filtered_results.append(result)
+
+    return filtered_results
+
+
+def query_booster(results:list, query:str, query_segs:str, docstore=None)->list:
     """基于字符串匹配的检索结果增强模块
 
     Args:
         results (list): 检索结果（URL/文档路径）
         query (str): 查询字符串
         query_segs (list): 查询字符串分词结果
+        docstore (MultiDocStore, optional): 文档存储，给出时从中读取正文，不存在的文档回退到读文件. Defaults to None.
     """
 
-    if isinstance(query_segs, str):
-        query_segs = query_segs.split("/")
-            
-    query_segs = sorted(query_segs, key=len)
-    if query_segs[-1] == query:
-        query_segs.pop()
+    query_segs = _booster_segs(query, query_segs)
     
+    scorer = QueryScorer(query, query_segs)
     scored_results = []
     for doc in results:
-        doc_file = os.path.join(doc, "index_content.txt")
-        with open(doc_file, 'r', encoding='utf-8') as file:
-            text = file.read()
-        score = calculate_score(text, query, query_segs)
+        stored = docstore.get(doc) if docstore is not None else None
+        if stored is not None:
+            text = stored[1]
+        else:
+            doc_file = os.path.join(doc, "index_content.txt")
+            with open(doc_file, 'r', encoding='utf-8') as file:
+                text = file.read()
+        score = scorer.score(text)
         scored_results.append((doc, score))
         
     scored_results.sort(key=lambda x: x[1], reverse=True)
     
-    filtered_results = []
-    
-    for result in scored_results:
-        if len(filtered_results) > 20:
-            break
-        if "index" in result[0]:
-            continue
-        filtered_results.append(result)
+    filtered_results = _filter_results(scored_results)
     
     # save_test_results(query, query_segs, [(os.path.relpath(result[0], "saved").replace("_", "://", 1), result[1]) for result in filtered_results])
     
-    return [result[0] for result in filtered_results]
\ No newline at end of file
+    return [result[0] for result in filtered_results]
+
+
+_worker_docstore = None
+
+
+def _init_rerank_worker(docstore_paths: list[str]) -> None:
+    """子进程初始化：文档存储只打开一次（mmap，多个进程共享页缓存）"""
+    global _worker_docstore
+    _worker_docstore = load_docstores(docstore_paths)
+
+
+def _rerank_chunk(chunk: list[tuple]) -> list[list]:
+    """对一组(检索结果, query, query分词)调用query_booster"""
+    return [
+        query_booster(results, query, query_segs, _worker_docstore)
+        for results, query, query_segs in chunk
+    ]
+
+
+def field_booster(index, results: list, query: str, query_segs) -> list:
+    """基于字段词频的检索结果增强模块：得分与query_booster相同（词频乘以分词长度的幂，
+    出现在标题或小标题中时幂次加一），但词频和是否出现在标题/小标题中都直接读取索引时记录的字段词频，
+    不读取正文；候选集是包含任一query分词的全部文档，而不只是相似度最高的top_k个
+
+    与query_booster的区别：只统计文档分词表中的词，是否"靠近标记"按词是否出现在标题或小标题中判断
+
+    Args:
+        index (FederatedIndex): 联合索引，需要field_postings和doc_name
+        results (list): 检索结果的文档编号（按相似度排序），得分相同时按这个顺序，其余候选按文档编号排在后面
+        query (str): 查询字符串
+        query_segs (list): 查询字符串分词结果
+
+    Returns:
+        list: 文档路径
+    """
+    query_segs = _booster_segs(query, query_segs)
+
+    all_docs = [np.asarray(results, dtype=np.int64)]
+    all_scores = [np.zeros(len(results))]
+    patterns = [(seg, 3, 2) for seg in query_segs] + [(query, 5, 4)]
+    for pattern, near_exponent, exponent in patterns:
+        # 空串的长度为0，不影响得分
+        postings = index.field_postings(pattern) if pattern else None
+        if postings is None:
+            continue
+        docs, tcs, fields = postings
+        exponents = np.where(fields.sum(axis=1) > 0, near_exponent, exponent)
+        all_docs.append(docs)
+        all_scores.append(np.power(float(len(pattern)), exponents) * tcs)
+
+    candidates, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(all_scores), minlength=len(candidates))
+    rank = np.full(len(candidates), len(results))
+    rank[np.searchsorted(candidates, all_docs[0])] = np.arange(len(results))
+    order = np.lexsort((candidates, rank, -scores))
+
+    filtered_results = _filter_results(
+        (index.doc_name(int(candidates[i])), int(scores[i])) for i in order
+    )
+    return [result[0] for result in filtered_results]
@@ -0,0 +1,39 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """令牌桶限速：平均每秒rate个请求，允许capacity个的突发
+
+    Args:
+        rate (float): 每秒补充的令牌数，<=0 表示不限速
+        capacity (float, optional): 桶容量. Defaults to 1.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预定一个令牌，返回调用方还需要等待的秒数（同步用time.sleep，异步用asyncio.sleep）"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        """阻塞直到拿到令牌"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
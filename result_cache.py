@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024**2  # 64MB
+DEFAULT_MAX_DISK_BYTES = 512 * 1024**2  # 512MB
+
+
+def normalize_query(query: str) -> str:
+    """规范化query：去掉首尾空白，连续空白合并为一个空格"""
+    return " ".join(query.split())
+
+
+def cache_key(query: str, domains, generations: tuple, **options) -> str:
+    """查询结果的缓存键：规范化后的query、排好序的域名、各域名的索引版本号以及影响结果的查询参数
+
+    Returns:
+        str: json字符串，可以直接用作字典键，也用来生成磁盘文件名
+    """
+    return json.dumps(
+        [normalize_query(query), sorted(domains), list(generations), options],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+
+
+class ResultCache:
+    """查询结果缓存：内存中按LRU淘汰，同时限制条目数和字节数；可选的磁盘层供多个进程共享
+
+    缓存键包含各域名的索引版本号（build.read_generations），域名重建或增量更新后版本号增加，
+    旧结果不会再被命中，随LRU淘汰；结果按json序列化保存，字节数即序列化后的大小
+
+    Args:
+        max_entries (int, optional): 内存中最多缓存的结果数. Defaults to 1024.
+        max_bytes (int, optional): 内存中缓存结果的总字节数上限. Defaults to 64MB.
+        disk_dir (str, optional): 磁盘层目录，None时不使用磁盘层. Defaults to None.
+        max_disk_bytes (int, optional): 磁盘层的总字节数上限，超过时删除最久未使用的文件. Defaults to 512MB.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        disk_dir: str = None,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def memory_usage(self) -> int:
+        with self._lock:
+            return self._bytes
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str):
+        """取出缓存的结果，不存在时返回None；磁盘层命中时放回内存"""
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return json.loads(blob)
+
+        blob = self._read_disk(key)
+        if blob is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._store(key, blob)
+        return json.loads(blob)
+
+    def put(self, key: str, value) -> None:
+        """缓存一个可以json序列化的结果"""
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._stats["puts"] += 1
+            self._store(key, blob)
+        if self.disk_dir is not None:
+            self._write_disk(key, blob)
+
+    def clear(self) -> None:
+        """清空内存中的结果（磁盘层不受影响）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """命中率等指标：hit_rate为内存和磁盘命中之和占全部查询的比例"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _store(self, key: str, blob: bytes) -> None:
+        # 调用方持有锁；单个超过字节上限的结果不缓存
+        if len(blob) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _read_disk(self, key: str):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        # 文件名是键的哈希，核对完整的键
+        if data.get("key") != key:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return json.dumps(data["value"], ensure_ascii=False).encode("utf-8")
+
+    def _write_disk(self, key: str, blob: bytes) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b'{"key":' + json.dumps(key).encode("utf-8") + b',"value":' + blob + b"}")
+        os.replace(tmp_path, path)
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """磁盘层超过字节上限时按修改时间（命中时会更新）删除最久未使用的文件"""
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get("CSEARCH_RESULT_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    max_bytes=int(os.environ.get("CSEARCH_RESULT_CACHE_BYTES", DEFAULT_MAX_BYTES)),
+    disk_dir=os.environ.get("CSEARCH_RESULT_CACHE_DIR") or None,
+)
@@ -0,0 +1,175 @@
+import math
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """部分选择出得分最高的top_k个下标，得分相同时下标小的在前（与稳定排序一致）
+
+    Args:
+        scores (np.ndarray): 每个文档的得分
+        top_k (int): 需要的数量
+
+    Returns:
+        np.ndarray: 按得分降序排列的下标
+    """
+    n = len(scores)
+    if top_k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= n:
+        return np.argsort(-scores, kind="stable")
+
+    part = np.argpartition(-scores, top_k - 1)[:top_k]
+    threshold = scores[part].min()
+    # 把与第k名并列的文档都纳入候选，保证并列时的顺序和完整排序一致
+    candidates = np.flatnonzero(scores >= threshold)
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return order[:top_k]
+
+
+def maxscore_top_k(index, query_tf_idf: dict, top_k: int) -> list[int]:
+    """按词项逐个遍历query词的倒排表累加得分(term-at-a-time)，用MaxScore上界提前终止
+
+    处理顺序按每个词可能贡献的最大得分降序；当剩余词的得分上界之和已经不足以让
+    新文档挤进top_k时，只再更新已有的候选文档，并剪掉不可能进入top_k的候选。
+    结果与对全部文档算余弦相似度后排序一致（并列时文档编号小的在前）。
+
+    Args:
+        index: 提供 len(index)、postings(term)、weight_bounds(term) 的索引，
+            postings返回(文档编号升序数组, 除以文档范数后的权重数组)，词不存在时返回None
+        query_tf_idf (dict): query的tf-idf
+        top_k (int): 返回数量
+
+    Returns:
+        list[int]: 按得分降序的文档编号
+    """
+    total_documents = len(index)
+    top_k = min(top_k, total_documents)
+    if top_k <= 0:
+        return []
+
+    query_norm = math.sqrt(sum(value**2 for value in query_tf_idf.values()))
+    if query_norm == 0:
+        return list(range(top_k))
+
+    terms = []
+    for term, value in query_tf_idf.items():
+        if value == 0:
+            continue
+        postings = index.postings(term)
+        if postings is None:
+            continue
+        docs, weights = postings
+        low, high = index.weight_bounds(term)
+        bounds = (value * low, value * high)
+        terms.append((max(max(bounds), 0.0), min(min(bounds), 0.0), docs, weights * value))
+
+    terms.sort(key=lambda item: item[0], reverse=True)
+    upper_rest = [0.0] * (len(terms) + 1)
+    lower_rest = [0.0] * (len(terms) + 1)
+    for i in range(len(terms) - 1, -1, -1):
+        upper_rest[i] = upper_rest[i + 1] + terms[i][0]
+        lower_rest[i] = lower_rest[i + 1] + terms[i][1]
+
+    cand_docs = np.empty(0, dtype=np.int64)
+    cand_scores = np.empty(0, dtype=np.float64)
+    pruning = False
+
+    for i, (_, _, docs, contributions) in enumerate(terms):
+        if not pruning and len(cand_docs) >= top_k:
+            # 第k名得分的下界高于未出现文档的得分上界，候选集合不会再增加
+            threshold = np.partition(cand_scores + lower_rest[i], -top_k)[-top_k]
+            if threshold > upper_rest[i]:
+                pruning = True
+
+        if pruning:
+            threshold = np.partition(cand_scores + lower_rest[i], -top_k)[-top_k]
+            keep = cand_scores + upper_rest[i] >= threshold
+            cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+            if len(docs) == 0:
+                continue
+            pos = np.searchsorted(docs, cand_docs)
+            pos[pos == len(docs)] = 0
+            hit = docs[pos] == cand_docs
+            cand_scores[hit] += contributions[pos[hit]]
+        else:
+            all_docs = np.concatenate((cand_docs, docs))
+            cand_docs, inverse = np.unique(all_docs, return_inverse=True)
+            cand_scores = np.bincount(
+                inverse,
+                weights=np.concatenate((cand_scores, contributions)),
+                minlength=len(cand_docs),
+            )
+
+    order = np.lexsort((cand_docs, -cand_scores))
+    positive = [int(cand_docs[j]) for j in order if cand_scores[j] > 0]
+    if pruning or len(positive) >= top_k:
+        return positive[:top_k]
+
+    # 候选不足k个时，按文档顺序补上得分为0的文档，最后是得分为负的文档
+    scored = {int(doc): score for doc, score in zip(cand_docs, cand_scores)}
+    results = positive
+    for doc in range(total_documents):
+        if len(results) >= top_k:
+            break
+        if scored.get(doc, 0.0) == 0:
+            results.append(doc)
+    negative = [int(cand_docs[j]) for j in order if cand_scores[j] < 0]
+    results.extend(negative[: top_k - len(results)])
+    return results
+
+
+def batch_top_k(
+    index, query_tf_idfs: list[dict], top_k: int, block_size: int = 256
+) -> list[list[int]]:
+    """一批query一起打分：把query的tf-idf排成 词 x query 的矩阵，与文档-词矩阵做一次矩阵-矩阵乘法，
+    每个词的倒排表只取一次，供这批中所有包含该词的query共用
+
+    结果与逐个调用maxscore_top_k相同（得分为正的按得分降序、并列时文档编号小的在前，
+    之后按文档顺序补上得分为0的文档），只在得分的浮点舍入上可能有差别
+
+    Args:
+        index: 提供 len(index)、postings(term) 的索引，见maxscore_top_k
+        query_tf_idfs (list[dict]): 每个query的tf-idf
+        top_k (int): 每个query返回的数量
+        block_size (int, optional): 每次相乘的query数，得分矩阵占用 文档数 x block_size 个float64. Defaults to 256.
+
+    Returns:
+        list[list[int]]: 每个query按得分降序的文档编号
+    """
+    total_documents = len(index)
+    top_k = min(top_k, total_documents)
+    # 得分矩阵不超过约64MB
+    block_size = max(1, min(block_size, (8 * 1024**2) // max(total_documents, 1)))
+
+    results = []
+    for block_start in range(0, len(query_tf_idfs), block_size):
+        block = query_tf_idfs[block_start : block_start + block_size]
+
+        # 词 -> 这批query中该词的权重（稠密的一行）
+        query_matrix = {}
+        for j, query_tf_idf in enumerate(block):
+            for term, value in query_tf_idf.items():
+                if value != 0:
+                    query_matrix.setdefault(term, np.zeros(len(block)))[j] += value
+
+        scores = np.zeros((total_documents, len(block)), dtype=np.float64)
+        for term, row in query_matrix.items():
+            postings = index.postings(term)
+            if postings is None:
+                continue
+            docs, weights = postings
+            columns = np.flatnonzero(row)
+            scores[np.ix_(docs, columns)] += np.outer(weights, row[columns])
+
+        for j, query_tf_idf in enumerate(block):
+            if top_k <= 0:
+                results.append([])
+                continue
+            query_norm = math.sqrt(sum(value**2 for value in query_tf_idf.values()))
+            if query_norm == 0:
+                results.append(list(range(top_k)))
+                continue
+            indices = top_k_indices(scores[:, j] / query_norm, top_k)
+            results.append([int(i) for i in indices])
+    return results
+
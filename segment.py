@@ -0,0 +1,332 @@
+import os
+import mmap
+import struct
+import numpy as np
+from scoring import maxscore_top_k, batch_top_k
+
+
+# 段文件格式（小端）:
+#   header: magic, version, num_docs, num_terms, 以及各个section的(offset, length)
+#   doc_offsets/doc_blob: 文档编号 -> 文档路径(utf-8)
+#   term_offsets/term_blob: 按utf-8字节序排好的词典
+#   term_table: 每个词的df、归一化权重上下界、倒排表和权重数组的起始位置
+#   postings: 文档编号做差分后varint编码的倒排表
+#   weights: 与倒排表对齐的float32权重
+#   norms: 每个文档权重向量的L2范数(float64)
+#   fields: 与倒排表对齐的(标题中出现次数, 小标题中出现次数)，没有字段信息时为空（version 2新增）
+MAGIC = b"CSEG"
+VERSION = 2
+SECTIONS_V1 = (
+    "doc_offsets",
+    "doc_blob",
+    "term_offsets",
+    "term_blob",
+    "term_table",
+    "postings",
+    "weights",
+    "norms",
+)
+SECTIONS = SECTIONS_V1 + ("fields",)
+HEADER = struct.Struct("<4sIII" + "QQ" * len(SECTIONS))
+HEADERS = {
+    1: (struct.Struct("<4sIII" + "QQ" * len(SECTIONS_V1)), SECTIONS_V1),
+    2: (HEADER, SECTIONS),
+}
+FIELDS_DTYPE = np.dtype([("title", "<u2"), ("heading", "<u2")])
+TERM_TABLE_DTYPE = np.dtype(
+    [("df", "<u4"), ("low", "<f4"), ("high", "<f4"), ("postings", "<u8"), ("weights", "<u8")]
+)
+
+
+def encode_varints(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """varint编码（每字节7位，最高位表示后面还有字节）
+
+    Args:
+        values (np.ndarray): 非负整数
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 编码后的字节，每个值占用的字节数
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+
+    width = int(nbytes.max()) if len(values) else 1
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    position = np.arange(width)
+    groups[position < (nbytes[:, None] - 1)] |= 0x80
+    return groups[position < nbytes[:, None]], nbytes
+
+
+def decode_varints(buffer: np.ndarray) -> np.ndarray:
+    """varint解码
+
+    Args:
+        buffer (np.ndarray): uint8字节
+
+    Returns:
+        np.ndarray: 解码出的整数
+    """
+    if len(buffer) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = (buffer & 0x80) == 0
+    group = np.concatenate(([0], np.cumsum(ends[:-1])))
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    shifts = (np.arange(len(buffer)) - starts[group]) * 7
+    parts = (buffer & 0x7F).astype(np.int64) << shifts
+    return np.bincount(group, weights=parts, minlength=len(starts)).astype(np.int64)
+
+
+def _pack_strings(strings: list[str]) -> tuple[bytes, bytes]:
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets.tobytes(), b"".join(encoded)
+
+
+def write_segment(file_path: str, doc_names: list[str], postings: dict) -> None:
+    """把倒排表写成二进制段文件
+
+    Args:
+        file_path (str): 段文件路径
+        doc_names (list[str]): 文档编号 -> 文档路径
+        postings (dict): term -> (文档编号升序列表, 权重列表)，
+            或 (文档编号升序列表, 权重列表, 字段词频)，字段词频是每个文档的(标题, 小标题)出现次数
+    """
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+    num_docs = len(doc_names)
+
+    dfs = np.array([len(postings[term][0]) for term in terms], dtype=np.int64)
+    weight_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(dfs, out=weight_offsets[1:])
+
+    docs = np.fromiter(
+        (doc for term in terms for doc in postings[term][0]),
+        dtype=np.int64,
+        count=int(weight_offsets[-1]),
+    )
+    weights = np.fromiter(
+        (weight for term in terms for weight in postings[term][1]),
+        dtype=np.float32,
+        count=int(weight_offsets[-1]),
+    )
+    fields = np.zeros(int(weight_offsets[-1]), dtype=FIELDS_DTYPE)
+    with_fields = any(len(postings[term]) > 2 for term in terms)
+    if with_fields:
+        for term, start in zip(terms, weight_offsets[:-1].tolist()):
+            if len(postings[term]) > 2:
+                term_fields = np.asarray(postings[term][2]).reshape(-1, 2)
+                counts = np.minimum(term_fields, np.iinfo(np.uint16).max)
+                fields["title"][start : start + len(counts)] = counts[:, 0]
+                fields["heading"][start : start + len(counts)] = counts[:, 1]
+
+    # 每个词的第一个文档编号相对0做差分
+    deltas = np.diff(docs, prepend=0)
+    term_starts = weight_offsets[:-1][dfs > 0]
+    deltas[term_starts] = docs[term_starts]
+    postings_bytes, nbytes = encode_varints(deltas)
+
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(
+            np.repeat(np.arange(len(terms)), dfs), weights=nbytes, minlength=len(terms)
+        ).astype(np.int64),
+        out=posting_offsets[1:],
+    )
+
+    norms = np.sqrt(
+        np.bincount(docs, weights=weights.astype(np.float64) ** 2, minlength=num_docs)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized = np.where(norms[docs] > 0, weights / norms[docs], 0.0)
+
+    term_table = np.zeros(len(terms), dtype=TERM_TABLE_DTYPE)
+    term_table["df"] = dfs
+    term_table["postings"] = posting_offsets[:-1]
+    term_table["weights"] = weight_offsets[:-1]
+    nonempty = dfs > 0
+    if nonempty.any():
+        # 上下界转float32时向外取整，保证MaxScore剪枝不会因为精度丢掉文档
+        low = np.minimum.reduceat(normalized, term_starts).astype(np.float32)
+        high = np.maximum.reduceat(normalized, term_starts).astype(np.float32)
+        term_table["low"][nonempty] = np.nextafter(low, np.float32(-np.inf))
+        term_table["high"][nonempty] = np.nextafter(high, np.float32(np.inf))
+
+    doc_offsets, doc_blob = _pack_strings(doc_names)
+    term_offsets, term_blob = _pack_strings(terms)
+    sections = {
+        "doc_offsets": doc_offsets,
+        "doc_blob": doc_blob,
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "term_table": term_table.tobytes(),
+        "postings": postings_bytes.tobytes(),
+        "weights": weights.astype("<f4").tobytes(),
+        "norms": norms.astype("<f8").tobytes(),
+        "fields": fields.tobytes() if with_fields else b"",
+    }
+
+    layout = []
+    offset = HEADER.size
+    for name in SECTIONS:
+        # float/整数数组按8字节对齐，便于np.frombuffer直接映射
+        offset += -offset % 8
+        layout.extend((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, num_docs, len(terms), *layout))
+        for name, section_offset in zip(SECTIONS, layout[::2]):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, file_path)
+
+
+def save_segment(table, file_path: str) -> None:
+    """把词频表或tf-idf表(TermTable)保存为段文件"""
+    doc_names, postings = table.postings()
+    write_segment(file_path, doc_names, postings)
+
+
+class Segment:
+    """mmap方式只读打开的段文件；词典、文档表和权重都直接映射，不构建Python字典
+
+    Args:
+        file_path (str): 段文件路径
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from("<4sI", self._mmap, 0)
+        if magic != MAGIC or version not in HEADERS:
+            raise ValueError(f"Not a segment file: {file_path}")
+        header, sections = HEADERS[version]
+        _, _, self.num_docs, self.num_terms, *layout = header.unpack_from(self._mmap, 0)
+        self._sections = {
+            name: (layout[2 * i], layout[2 * i + 1]) for i, name in enumerate(sections)
+        }
+
+        self.doc_offsets = self._array("doc_offsets", "<u8")
+        self.term_offsets = self._array("term_offsets", "<u8")
+        self.term_table = self._array("term_table", TERM_TABLE_DTYPE)
+        self.postings_bytes = self._array("postings", np.uint8)
+        self.weights = self._array("weights", "<f4")
+        self.norms = self._array("norms", "<f8")
+        # 没有字段信息的段（包括version 1）为None
+        fields = self._array("fields", FIELDS_DTYPE) if "fields" in self._sections else None
+        self.fields = fields if fields is not None and len(fields) else None
+        self._doc_blob = self._sections["doc_blob"][0]
+        self._term_blob = self._sections["term_blob"][0]
+
+    def _array(self, name: str, dtype) -> np.ndarray:
+        offset, length = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mmap, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    @property
+    def nbytes(self) -> int:
+        """映射的段文件大小"""
+        return len(self._mmap)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def doc_name(self, doc_id: int) -> str:
+        start = self._doc_blob + int(self.doc_offsets[doc_id])
+        end = self._doc_blob + int(self.doc_offsets[doc_id + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def term(self, term_id: int) -> str:
+        start = self._term_blob + int(self.term_offsets[term_id])
+        end = self._term_blob + int(self.term_offsets[term_id + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def term_id(self, term: str):
+        """在词典上二分查找，找不到返回None"""
+        key = term.encode("utf-8")
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            start = self._term_blob + int(self.term_offsets[middle])
+            end = self._term_blob + int(self.term_offsets[middle + 1])
+            current = self._mmap[start:end]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def __contains__(self, term: str) -> bool:
+        return self.term_id(term) is not None
+
+    def __getitem__(self, term: str) -> np.ndarray:
+        """与倒排索引字典兼容：返回包含该词的文档编号"""
+        postings = self.raw_postings(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings[0]
+
+    def document_frequency(self, term: str) -> int:
+        term_id = self.term_id(term)
+        return 0 if term_id is None else int(self.term_table["df"][term_id])
+
+    def raw_postings(self, term: str):
+        """返回词的(文档编号数组, float32原始权重)，词不存在时返回None"""
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        entry = self.term_table[term_id]
+        start = int(entry["postings"])
+        if term_id + 1 < self.num_terms:
+            end = int(self.term_table["postings"][term_id + 1])
+        else:
+            end = len(self.postings_bytes)
+        docs = np.cumsum(decode_varints(self.postings_bytes[start:end]))
+        weight_start = int(entry["weights"])
+        return docs, self.weights[weight_start : weight_start + int(entry["df"])]
+
+    def raw_fields(self, term: str):
+        """返回与raw_postings对齐的字段词频(标题, 小标题)，词不存在或段没有字段信息时返回None"""
+        term_id = self.term_id(term)
+        if term_id is None or self.fields is None:
+            return None
+        entry = self.term_table[term_id]
+        start = int(entry["weights"])
+        return self.fields[start : start + int(entry["df"])]
+
+    def postings(self, term: str):
+        """返回词的(文档编号数组, 除以文档范数后的权重)，供maxscore_top_k使用"""
+        postings = self.raw_postings(term)
+        if postings is None:
+            return None
+        docs, weights = postings
+        norms = self.norms[docs]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return docs, np.where(norms > 0, weights / norms, 0.0)
+
+    def weight_bounds(self, term: str) -> tuple[float, float]:
+        entry = self.term_table[self.term_id(term)]
+        return float(entry["low"]), float(entry["high"])
+
+    def top_k(self, query_tf_idf: dict, top_k: int, method: str = "maxscore") -> list[int]:
+        """返回与query余弦相似度最高的top_k个文档编号（只支持maxscore），用doc_name解析路径"""
+        if method != "maxscore":
+            raise ValueError(f"Unsupported scoring method for segments: {method}")
+        return maxscore_top_k(self, query_tf_idf, top_k)
+
+    def batch_top_k(self, query_tf_idfs: list[dict], top_k: int) -> list[list[int]]:
+        """一批query一起打分，见scoring.batch_top_k"""
+        return batch_top_k(self, query_tf_idfs, top_k)
@@ -0,0 +1,328 @@
+import os
+import math
+import time
+import threading
+import numpy as np
+from segment import Segment, write_segment
+from federation import segment_term_stats, segment_fields
+from lexicon import TermTable
+from utils import save_dict_json, load_dict_json
+
+
+SEGMENTS_DIR = "segments"
+MANIFEST = "manifest.json"
+OBSOLETE_GRACE = 60.0  # 秒，合并掉的段文件保留一段时间，正在打开旧清单的查询仍能读到
+
+
+def load_snapshot(manifest_path: str) -> tuple[list[str], list[list[int]]]:
+    """读取清单中所有存活的段和每个段的墓碑（已删除的段内文档编号）
+
+    Args:
+        manifest_path (str): 清单路径
+
+    Returns:
+        tuple[list[str], list[list[int]]]: 段文件路径，每个段的墓碑
+    """
+    directory = os.path.dirname(manifest_path)
+    manifest = load_dict_json(manifest_path)
+    paths = []
+    deleted = []
+    for entry in manifest["segments"]:
+        paths.append(os.path.join(directory, entry["name"]))
+        deleted.append(manifest["tombstones"].get(entry["name"], []))
+    return paths, deleted
+
+
+class SegmentStore:
+    """一个域名的段式索引：不可变的词频段文件 + 清单(manifest.json)
+
+    新文档写入一个新的小段，文档的旧版本和被删除的文档在清单里记为墓碑；
+    清单通过原子替换更新，查询总是读到一致的快照，写入不阻塞查询。
+    段按存活文档数分层(size-tiered)，同一层攒够merge_factor个段时合并成一个大段，
+    合并时丢掉墓碑文档；合并可以在后台线程中进行
+
+    Args:
+        directory (str): 段目录，一般是 域名目录/segments
+        merge_factor (int, optional): 每层攒够多少个段时合并. Defaults to 8.
+        min_docs (int, optional): 最底层段的文档数规模. Defaults to 64.
+    """
+
+    def __init__(self, directory: str, merge_factor: int = 8, min_docs: int = 64):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self.merge_factor = merge_factor
+        self.min_docs = min_docs
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merger = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            self._manifest = load_dict_json(self.manifest_path)
+        else:
+            self._manifest = {"next_id": 0, "segments": [], "tombstones": {}, "obsolete": []}
+            self._commit()
+
+        # 存活文档 -> (段名, 段内编号)，用于给文档的旧版本打墓碑
+        self._locations = {}
+        for entry in self._manifest["segments"]:
+            self._index_segment(entry["name"])
+
+    @classmethod
+    def for_domain(cls, save_path: str, **kwargs) -> "SegmentStore":
+        return cls(os.path.join(save_path, SEGMENTS_DIR), **kwargs)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._locations)
+
+    def __contains__(self, document_id: str) -> bool:
+        with self._lock:
+            return document_id in self._locations
+
+    @property
+    def segments(self) -> list[str]:
+        with self._lock:
+            return [entry["name"] for entry in self._manifest["segments"]]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _index_segment(self, name: str) -> None:
+        segment = Segment(self._path(name))
+        removed = set(self._manifest["tombstones"].get(name, []))
+        for doc_id in range(len(segment)):
+            if doc_id not in removed:
+                self._locations[segment.doc_name(doc_id)] = (name, doc_id)
+
+    def _new_name(self) -> str:
+        name = f"seg_{self._manifest['next_id']:06d}.seg"
+        self._manifest["next_id"] += 1
+        return name
+
+    def _commit(self) -> None:
+        """原子地写入清单，顺便删除宽限期已过的旧段文件"""
+        now = time.time()
+        obsolete = []
+        for name, retired in self._manifest["obsolete"]:
+            if now - retired >= OBSOLETE_GRACE:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            else:
+                obsolete.append([name, retired])
+        self._manifest["obsolete"] = obsolete
+        save_dict_json(self._manifest, self.manifest_path)
+
+    def _tombstone(self, document_id: str) -> None:
+        location = self._locations.pop(document_id, None)
+        if location is not None:
+            name, doc_id = location
+            self._manifest["tombstones"].setdefault(name, []).append(doc_id)
+
+    def add(self, term_counts: TermTable) -> None:
+        """把一批文档写成一个新段；已存在的文档视为更新，旧版本打上墓碑
+
+        Args:
+            term_counts (TermTable): 词频表
+        """
+        if not len(term_counts):
+            return
+        doc_names, postings = term_counts.postings()
+        with self._lock:
+            name = self._new_name()
+        # 写段文件不持有锁，查询和其他写入不受影响
+        write_segment(self._path(name), doc_names, postings)
+
+        with self._lock:
+            for doc_id, document_id in enumerate(doc_names):
+                self._tombstone(document_id)
+                self._locations[document_id] = (name, doc_id)
+            self._manifest["segments"].append({"name": name, "docs": len(doc_names)})
+            self._commit()
+        self._wakeup.set()
+
+    def delete(self, document_ids) -> int:
+        """给文档打上墓碑，返回实际删除的文档数"""
+        with self._lock:
+            removed = 0
+            for document_id in document_ids:
+                if document_id in self._locations:
+                    self._tombstone(document_id)
+                    removed += 1
+            if removed:
+                self._commit()
+        if removed:
+            self._wakeup.set()
+        return removed
+
+    def reset(self, term_counts: TermTable = None) -> None:
+        """丢弃所有段（全量重建），可选地用一批文档作为唯一的段"""
+        with self._merge_lock:
+            with self._lock:
+                now = time.time()
+                for entry in self._manifest["segments"]:
+                    self._manifest["obsolete"].append([entry["name"], now])
+                self._manifest["segments"] = []
+                self._manifest["tombstones"] = {}
+                self._locations = {}
+                self._commit()
+            if term_counts is not None:
+                self.add(term_counts)
+
+    def _tier(self, live: int) -> int:
+        return max(0, int(math.log(max(live, 1) / self.min_docs, self.merge_factor) + 1e-9))
+
+    def _pick_merge(self) -> list[str]:
+        """选出需要合并的段：同一层最早的merge_factor个段；或墓碑超过一半的单个段"""
+        with self._lock:
+            tiers = {}
+            for entry in self._manifest["segments"]:
+                name = entry["name"]
+                live = entry["docs"] - len(self._manifest["tombstones"].get(name, []))
+                if entry["docs"] and live * 2 < entry["docs"]:
+                    return [name]
+                tiers.setdefault(self._tier(live), []).append(name)
+        for names in tiers.values():
+            if len(names) >= self.merge_factor:
+                return names[: self.merge_factor]
+        return []
+
+    def maybe_merge(self) -> bool:
+        """按合并策略做一次合并，返回是否合并了"""
+        with self._merge_lock:
+            names = self._pick_merge()
+            if not names:
+                return False
+            self._merge(names)
+            return True
+
+    def _merge(self, names: list[str]) -> None:
+        with self._lock:
+            tombstones = {name: set(self._manifest["tombstones"].get(name, [])) for name in names}
+            merged_name = self._new_name()
+
+        # 读取和写入都在锁外进行；段文件不可变，只需要在替换清单时处理合并期间新增的墓碑
+        doc_names = []
+        postings = {}
+        id_maps = {}
+        base = 0
+        for name in names:
+            segment = Segment(self._path(name))
+            live = np.ones(len(segment), dtype=bool)
+            live[list(tombstones[name])] = False
+            live_docs = np.flatnonzero(live)
+            id_map = np.full(len(segment), -1, dtype=np.int64)
+            id_map[live_docs] = base + np.arange(len(live_docs))
+            id_maps[name] = id_map
+            doc_names.extend(segment.doc_name(int(doc_id)) for doc_id in live_docs)
+            base += len(live_docs)
+
+            terms, _, term_of_posting, docs, tcs = segment_term_stats(segment)
+            new_docs = id_map[docs]
+            fields = segment_fields(segment)
+            for term_id, doc_id, tc, field in zip(
+                term_of_posting.tolist(), new_docs.tolist(), tcs.tolist(), fields.tolist()
+            ):
+                if doc_id >= 0:
+                    term_docs, term_tcs, term_fields = postings.setdefault(
+                        terms[term_id], ([], [], [])
+                    )
+                    term_docs.append(doc_id)
+                    term_tcs.append(tc)
+                    term_fields.append(field)
+
+        postings = {term: value for term, value in postings.items() if value[0]}
+        if doc_names:
+            write_segment(self._path(merged_name), doc_names, postings)
+
+        with self._lock:
+            now = time.time()
+            merged_tombstones = []
+            for name in names:
+                for doc_id in self._manifest["tombstones"].pop(name, []):
+                    if doc_id not in tombstones[name]:
+                        merged_tombstones.append(int(id_maps[name][doc_id]))
+            for document_id, (name, doc_id) in list(self._locations.items()):
+                if name in id_maps:
+                    self._locations[document_id] = (merged_name, int(id_maps[name][doc_id]))
+
+            position = min(
+                i for i, entry in enumerate(self._manifest["segments"]) if entry["name"] in names
+            )
+            segments = [
+                entry for entry in self._manifest["segments"] if entry["name"] not in names
+            ]
+            if doc_names:
+                segments.insert(position, {"name": merged_name, "docs": len(doc_names)})
+                if merged_tombstones:
+                    self._manifest["tombstones"][merged_name] = merged_tombstones
+            self._manifest["segments"] = segments
+            self._manifest["obsolete"].extend([name, now] for name in names)
+            self._commit()
+
+    def start_merger(self, interval: float = 1.0) -> None:
+        """启动后台合并线程：每次写入后或每隔interval秒检查一次合并策略"""
+        if self._merger is not None and self._merger.is_alive():
+            return
+        self._stop.clear()
+
+        def run() -> None:
+            while not self._stop.is_set():
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+                while not self._stop.is_set() and self.maybe_merge():
+                    pass
+
+        self._merger = threading.Thread(target=run, daemon=True)
+        self._merger.start()
+
+    def stop_merger(self) -> None:
+        if self._merger is not None:
+            self._stop.set()
+            self._wakeup.set()
+            self._merger.join()
+            self._merger = None
+
+    def term_counts(self) -> TermTable:
+        """导出所有存活文档的词频表"""
+        paths, deleted = load_snapshot(self.manifest_path)
+        term_counts = TermTable()
+        for path, removed in zip(paths, deleted):
+            segment = Segment(path)
+            removed = set(removed)
+            terms, _, term_of_posting, docs, tcs = segment_term_stats(segment)
+            term_map = np.fromiter(
+                (term_counts.terms.add(term) for term in terms), dtype=np.int32, count=len(terms)
+            )
+            # 段内倒排按词排列，按文档稳定排序后每个文档的词仍按词编号升序
+            order = np.argsort(docs, kind="stable")
+            row_terms = term_map[term_of_posting[order]]
+            row_tcs = np.rint(tcs[order]).astype(np.int64)
+            row_fields = segment_fields(segment)[order]
+            bounds = np.searchsorted(docs[order], np.arange(len(segment) + 1))
+            for doc_id in range(len(segment)):
+                if doc_id not in removed:
+                    start, end = bounds[doc_id], bounds[doc_id + 1]
+                    term_counts.add_row(
+                        segment.doc_name(doc_id),
+                        row_terms[start:end],
+                        row_tcs[start:end],
+                        row_fields[start:end],
+                    )
+        return term_counts
+
+
+def domain_manifest_path(save_path: str) -> str:
+    return os.path.join(save_path, SEGMENTS_DIR, MANIFEST)
+
+
+def open_domain_store(save_path: str, **kwargs) -> SegmentStore:
+    """打开域名的段式索引；在段式索引之前构建的域名先从term_counts.json导入"""
+    exists = os.path.exists(domain_manifest_path(save_path))
+    store = SegmentStore.for_domain(save_path, **kwargs)
+    term_counts_path = os.path.join(save_path, "term_counts.json")
+    if not exists and os.path.exists(term_counts_path):
+        store.reset(TermTable.load(term_counts_path, "tc"))
+    return store
@@ -0,0 +1,219 @@
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.insert(0, parent_dir)
+
+from async_crawler import links_scraper_async, links_scraper_async_run
+from crawler import links_scraper_bfs_parallel, page_path
+from utils import url_to_path
+
+
+# 本地站点：路径 -> 页面中的链接；每层只有一个新链接，抓取顺序确定。
+# /b/在中断测试中阻塞，模拟中断时仍在进行中的请求
+SITE = {
+    "/": ["/a/"],
+    "/a/": ["/a/x/", "/"],
+    "/a/x/": ["/b/", "/a/"],
+    "/b/": ["/b/y/"],
+    "/b/y/": ["/"],
+}
+
+
+def write_site(directory: str) -> None:
+    for path, links in SITE.items():
+        page_dir = os.path.join(directory, path.strip("/"))
+        os.makedirs(page_dir, exist_ok=True)
+        anchors = "".join(f'<p><a href="{link}">{link}</a></p>' for link in links)
+        with open(os.path.join(page_dir, "index.html"), "w", encoding="utf-8") as f:
+            f.write(
+                f"<html><head><title>page {path}</title></head>"
+                f"<body><h2>heading {path}</h2>{anchors}</body></html>"
+            )
+
+
+class SiteHandler(SimpleHTTPRequestHandler):
+    """记录每个请求的路径；gate未打开时阻塞slow_paths中的页面，
+    failing_paths中的页面第一次请求返回500"""
+
+    requests = None
+    gate = None
+    slow_paths = ()
+    failing_paths = None
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path in self.failing_paths:
+            self.failing_paths.discard(self.path)
+            self.send_error(500)
+            return
+        if self.path in self.slow_paths:
+            self.gate.wait(timeout=10)
+        try:
+            super().do_GET()
+        except (BrokenPipeError, ConnectionResetError):
+            # 被中断的爬虫已经关闭了连接
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def saved_pages(save_path: str) -> dict:
+    """保存目录下所有html的 {相对路径: 内容}"""
+    pages = {}
+    for root, _, files in os.walk(save_path):
+        if "index.html" in files:
+            file_path = os.path.join(root, "index.html")
+            with open(file_path, "r", encoding="utf-8") as f:
+                pages[os.path.relpath(file_path, save_path)] = f.read()
+    return pages
+
+
+class AsyncCrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        site_dir = os.path.join(self.tmp.name, "site")
+        write_site(site_dir)
+
+        self.requests = []
+        self.gate = threading.Event()
+        handler = type(
+            "Handler",
+            (SiteHandler,),
+            {
+                "requests": self.requests,
+                "gate": self.gate,
+                "slow_paths": (),
+                "failing_paths": set(),
+            },
+        )
+        self.handler = handler
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(handler, directory=site_dir)
+        )
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.domain = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.url = self.domain + "/"
+        self.root = os.path.join(self.tmp.name, "saved")
+
+    def tearDown(self):
+        self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def crawl_async(self, root: str, **kwargs) -> str:
+        save_path = url_to_path(self.domain, root)
+        links_scraper_async_run(
+            self.url, self.domain, save_path, per_host_rate=0, **kwargs
+        )
+        return save_path
+
+    def test_layout_matches_threaded_crawler(self):
+        save_path = self.crawl_async(os.path.join(self.root, "async"))
+
+        expected = {
+            os.path.relpath(page_path(self.domain + path, save_path), save_path)
+            for path in SITE
+        }
+        pages = saved_pages(save_path)
+        self.assertEqual(set(pages), expected)
+
+        threads_path = url_to_path(self.domain, os.path.join(self.root, "threads"))
+        links_scraper_bfs_parallel(self.url, self.domain, threads_path, rate=0)
+        self.assertEqual(pages, saved_pages(threads_path))
+
+    def test_failed_page_is_retried(self):
+        crawlers = {
+            "async": lambda save_path: links_scraper_async_run(
+                self.url, self.domain, save_path, per_host_rate=0
+            ),
+            "threads": lambda save_path: links_scraper_bfs_parallel(
+                self.url, self.domain, save_path, rate=0
+            ),
+        }
+        for name, crawl in crawlers.items():
+            with self.subTest(crawler=name):
+                self.handler.failing_paths.add("/a/x/")
+                self.requests.clear()
+                save_path = url_to_path(self.domain, os.path.join(self.root, name))
+                crawl(save_path)
+
+                self.assertEqual(self.requests.count("/a/x/"), 2)
+                self.assertEqual(set(saved_pages(save_path)), {
+                    os.path.relpath(page_path(self.domain + path, save_path), save_path)
+                    for path in SITE
+                })
+
+    def test_retries_are_capped(self):
+        # 一直失败的页面最多请求1+max_retries次
+        class AlwaysFailing(set):
+            def discard(self, path):
+                pass
+
+        self.handler.failing_paths = AlwaysFailing({"/b/"})
+        save_path = self.crawl_async(self.root, max_retries=2)
+
+        self.assertEqual(self.requests.count("/b/"), 3)
+        self.assertNotIn("/b/y/", self.requests)
+        self.assertFalse(os.path.exists(page_path(self.domain + "/b/", save_path)))
+
+    def test_resume_after_interrupt(self):
+        self.handler.slow_paths = ("/b/",)
+        save_path = url_to_path(self.domain, self.root)
+
+        async def interrupted_crawl():
+            task = asyncio.create_task(
+                links_scraper_async(
+                    self.url,
+                    self.domain,
+                    save_path,
+                    per_host_rate=0,
+                    checkpoint_interval=1,
+                )
+            )
+            # /b/在/a/x/完成并checkpoint之后才发出，请求到达时中断爬虫
+            for _ in range(200):
+                if "/b/" in self.requests:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertFalse(task.done())
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(interrupted_crawl())
+        self.assertFalse(os.path.exists(page_path(self.domain + "/b/", save_path)))
+        interrupted_requests = list(self.requests)
+
+        self.gate.set()
+        self.crawl_async(self.root)
+
+        expected = {
+            os.path.relpath(page_path(self.domain + path, save_path), save_path)
+            for path in SITE
+        }
+        self.assertEqual(set(saved_pages(save_path)), expected)
+
+        # 中断前完成并checkpoint的网页不会重新抓取，续爬从进行中的/b/开始
+        self.assertEqual(interrupted_requests, ["/", "/a/", "/a/x/", "/b/"])
+        self.assertEqual(self.requests[len(interrupted_requests) :], ["/b/", "/b/y/"])
+
+        # 已经爬完，再次运行不再发出请求
+        finished_requests = len(self.requests)
+        self.crawl_async(self.root)
+        self.assertEqual(len(self.requests), finished_requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.insert(0, parent_dir)
+
+from index_manager import IndexManager, load_federated
+from lexicon import TermTable
+from segment_store import SegmentStore, domain_manifest_path
+
+
+def build_domain(save_path: str, documents: int) -> str:
+    """写出一个只有一个段的域名段式索引，返回清单路径"""
+    term_counts = TermTable()
+    for i in range(documents):
+        term_counts.add(
+            os.path.join(save_path, f"p{i}"),
+            {f"term{j}": 1 + (i + j) % 5 for j in range(i % 40, i % 40 + 30)},
+        )
+    SegmentStore.for_domain(save_path).reset(term_counts)
+    return domain_manifest_path(save_path)
+
+
+class IndexManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifests = {
+            name: build_domain(os.path.join(self.tmp.name, name), 200) for name in "abc"
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_federated_cost_includes_segments_and_arrays(self):
+        manager = IndexManager()
+        index = manager.get_federated("a", [self.manifests["a"]])
+
+        segment_bytes = sum(segment.nbytes for segment in index.segments)
+        self.assertGreater(manager.memory_usage, segment_bytes)
+        self.assertEqual(manager.memory_usage, index.nbytes)
+        self.assertGreater(manager.memory_usage, os.path.getsize(self.manifests["a"]))
+
+    def test_small_budget_evicts_least_recently_used(self):
+        cost = load_federated([self.manifests["a"]]).nbytes
+        # 预算只够放下两个联合索引
+        manager = IndexManager(memory_budget=int(cost * 2.5))
+
+        manager.get_federated("a", [self.manifests["a"]])
+        manager.get_federated("b", [self.manifests["b"]])
+        manager.get_federated("a", [self.manifests["a"]])
+        manager.get_federated("c", [self.manifests["c"]])
+
+        self.assertIn("a", manager)
+        self.assertNotIn("b", manager)
+        self.assertIn("c", manager)
+        self.assertLessEqual(manager.memory_usage, manager.memory_budget)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,11 @@
 import os
+import time
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from bs4 import BeautifulSoup
 import jieba
+from extract import extract_content, load_record
 
 
 def load_stopwords(stopwords_dir: str) -> set:
@@ -21,6 +26,85 @@ def load_stopwords(stopwords_dir: str) -> set:
     return stopwords
 
 
+STOPWORDS_CHECK_INTERVAL = 5.0  # 秒
+
+_stopwords_cache = {}
+_stopwords_lock = threading.Lock()
+
+
+def stopwords_signature(stopwords_dir: str) -> tuple:
+    """停用词目录下所有.txt文件的(文件名, mtime, 大小)，用来判断停用词是否变化"""
+    signature = []
+    for filename in sorted(os.listdir(stopwords_dir)):
+        if filename.endswith(".txt"):
+            stat = os.stat(os.path.join(stopwords_dir, filename))
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def compile_stopwords(stopwords_dir: str, compiled_path: str) -> frozenset:
+    """把停用词预编译成一个pickle文件，下次进程启动时直接加载
+
+    Args:
+        stopwords_dir (str): 停用词目录
+        compiled_path (str): 预编译文件路径
+
+    Returns:
+        frozenset: 停用词集合
+    """
+    signature = stopwords_signature(stopwords_dir)
+    stopwords = frozenset(load_stopwords(stopwords_dir))
+    tmp_path = compiled_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((signature, stopwords), f)
+    os.replace(tmp_path, compiled_path)
+    return stopwords
+
+
+def _load_compiled_stopwords(compiled_path: str, signature: tuple):
+    try:
+        with open(compiled_path, "rb") as f:
+            compiled_signature, stopwords = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    return stopwords if compiled_signature == signature else None
+
+
+def get_stopwords(stopwords_dir: str, compiled_path: str = None) -> frozenset:
+    """进程内共享的停用词表：按目录路径缓存，停用词文件的mtime变化后才重新加载
+
+    Args:
+        stopwords_dir (str): 停用词目录
+        compiled_path (str, optional): 预编译文件路径，给出时优先从该文件加载，过期则重新生成. Defaults to None.
+
+    Returns:
+        frozenset: 停用词集合
+    """
+    key = os.path.abspath(stopwords_dir)
+    now = time.monotonic()
+    cached = _stopwords_cache.get(key)
+    if cached is not None and now - cached[2] < STOPWORDS_CHECK_INTERVAL:
+        return cached[1]
+
+    with _stopwords_lock:
+        signature = stopwords_signature(stopwords_dir)
+        cached = _stopwords_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            _stopwords_cache[key] = (signature, cached[1], now)
+            return cached[1]
+
+        stopwords = None
+        if compiled_path:
+            stopwords = _load_compiled_stopwords(compiled_path, signature)
+            if stopwords is None:
+                stopwords = compile_stopwords(stopwords_dir, compiled_path)
+        if stopwords is None:
+            stopwords = frozenset(load_stopwords(stopwords_dir))
+
+        _stopwords_cache[key] = (signature, stopwords, now)
+        return stopwords
+
+
 def extract_text(file_path: str) -> str:
     """提取html文件中的文本内容
 
@@ -32,29 +116,15 @@ def extract_text(file_path: str) -> str:
     """
     with open(file_path, "r", encoding="utf-8") as file:
         soup = BeautifulSoup(file, "html.parser")
-        content = []
+        return extract_content(soup)[0]
 
-        if soup.title:
-            content.append(f"#{soup.title.string.strip()}")
 
-        for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p", "li"]):
-            text = element.get_text(strip=True)
-            if element.name.startswith("h"):
-                content.append(f"#{text}#")
-            
-            elif element.name == "p":
-                paragraph_text = "".join(
-                    child.get_text(strip=True)
-                    for child in element.find_all(string=True)
-                )
-                if paragraph_text:
-                    content.append(paragraph_text)
-
-            elif element.name == "li":
-                content.append(f"- {text}")
-
-        full_text = "\n\n".join(content)
-        return full_text
+def page_text(file_path: str) -> str:
+    """网页的文本内容：爬虫保存了页面记录(index_record.json)时直接读取，否则解析html"""
+    record = load_record(file_path)
+    if record is not None:
+        return record["text"]
+    return extract_text(file_path)
 
 
 def segment_text(text: str, stopwords_dir: str) -> str:
@@ -68,9 +138,13 @@ def segment_text(text: str, stopwords_dir: str) -> str:
         str: 分词后的文本
     """
 
-    stopwords = load_stopwords(stopwords_dir)
+    stopwords = get_stopwords(stopwords_dir)
+
+    return join_words(jieba.cut_for_search(text), stopwords)
+
 
-    words = jieba.cut_for_search(text)
+def join_words(words, stopwords: set) -> str:
+    """过滤停用词和空白词，返回用"/"分割后的文本"""
 
     filtered_words = [word for word in words if word not in stopwords and word.strip()]
 
@@ -80,7 +154,7 @@ def segment_text(text: str, stopwords_dir: str) -> str:
 
 def segment_query(text: str, stopwords_dir: str) -> str:
 
-    stopwords = load_stopwords(stopwords_dir)
+    stopwords = get_stopwords(stopwords_dir)
     words = jieba.cut(text, cut_all=False)
 
     filtered_words = [word for word in words if word not in stopwords and word.strip()]
@@ -90,34 +164,101 @@ def segment_query(text: str, stopwords_dir: str) -> str:
     return segmented_text
 
 
-def token4search(stopwords_dir: str, save_path: str) -> None:
+def html_files(save_path: str) -> list[str]:
+    """按os.walk顺序列出目录下所有的html文件"""
+    file_paths = []
+    for root, _, files in os.walk(save_path):
+        for file in files:
+            if file.endswith(".html") or file.endswith(".htm"):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+def write_tokens(file_path: str, text: str, segmented_text: str) -> None:
+    """把提取的文本和分词结果保存到html同目录下的_content.txt和_segmented.txt"""
+    output_file_path = os.path.splitext(file_path)[0] + "_content.txt"
+    with open(output_file_path, "w", encoding="utf-8") as output_file:
+        output_file.write(text)
+
+    segmented_output_path = os.path.splitext(file_path)[0] + "_segmented.txt"
+    with open(segmented_output_path, "w", encoding="utf-8") as segmented_file:
+        segmented_file.write(segmented_text)
+
+
+_worker_stopwords = None
+
+
+def _init_tokenize_worker(stopwords_dir: str) -> None:
+    """子进程初始化：jieba词典和停用词只加载一次"""
+    global _worker_stopwords
+    jieba.initialize()
+    _worker_stopwords = get_stopwords(stopwords_dir)
+
+
+def _tokenize_chunk(file_paths: list[str]) -> list[tuple]:
+    results = []
+    for file_path in file_paths:
+        text = page_text(file_path)
+        segmented_text = join_words(jieba.cut_for_search(text), _worker_stopwords)
+        results.append((file_path, text, segmented_text))
+    return results
+
+
+def token4search(
+    stopwords_dir: str, save_path: str, workers: int = 1, chunksize: int = 64
+) -> None:
     """将整个目录下的html文件提取文本内容并分词，保存到同目录下的_content.txt和_segmented.txt文件中
 
     Args:
         stopwords_dir (str): 停用词目录
         save_path (str): 保存目标路径
+        workers (int, optional): 分词进程数，大于1时使用进程池并行分词. Defaults to 1.
+        chunksize (int, optional): 并行时每个任务包含的html文件数. Defaults to 64.
     """
 
     if not os.path.exists(save_path):
         print("Error: domain save_path does not exist.")
 
-    for root, _, files in os.walk(save_path):
-        for file in files:
-            if file.endswith(".html") or file.endswith(".htm"):
-                file_path = os.path.join(root, file)
+    if workers > 1:
+        token4search_parallel(stopwords_dir, save_path, workers, chunksize)
+        return
 
-                text = extract_text(file_path)
-                output_file_path = os.path.splitext(file_path)[0] + "_content.txt"
-                with open(output_file_path, "w", encoding="utf-8") as output_file:
-                    output_file.write(text)
+    for file_path in html_files(save_path):
+        text = page_text(file_path)
+        segmented_text = segment_text(text, stopwords_dir)
+        write_tokens(file_path, text, segmented_text)
 
-                segmented_text = segment_text(text, stopwords_dir)
 
-                segmented_output_path = (
-                    os.path.splitext(file_path)[0] + "_segmented.txt"
-                )
+def token4search_parallel(
+    stopwords_dir: str, save_path: str, workers: int, chunksize: int = 64
+) -> None:
+    """多进程版本的token4search，输出与串行版本逐字节一致，结束后打印吞吐量
 
-                with open(
-                    segmented_output_path, "w", encoding="utf-8"
-                ) as segmented_file:
-                    segmented_file.write(segmented_text)
\ No newline at end of file
+    Args:
+        stopwords_dir (str): 停用词目录
+        save_path (str): 保存目标路径
+        workers (int): 进程数
+        chunksize (int, optional): 每个任务包含的html文件数. Defaults to 64.
+    """
+    start = time.perf_counter()
+    file_paths = html_files(save_path)
+    chunks = [
+        file_paths[i : i + chunksize] for i in range(0, len(file_paths), chunksize)
+    ]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_tokenize_worker,
+        initargs=(stopwords_dir,),
+    ) as executor:
+        futures = [executor.submit(_tokenize_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for file_path, text, segmented_text in future.result():
+                write_tokens(file_path, text, segmented_text)
+
+    elapsed = time.perf_counter() - start
+    pages_per_second = len(file_paths) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"tokenize: {len(file_paths)} pages in {elapsed:.2f}s "
+        f"({pages_per_second:.1f} pages/s, {workers} workers)"
+    )
@@ -1,5 +1,4 @@
 import os
-import re
 import json
 from collections import deque
 from urllib.parse import urlparse
@@ -37,11 +36,6 @@ def configure_logging(save_path: str) -> None:
     )
 
 
-def save_state(fp_links: set, queue: deque, save_path: str) -> None:
-    with open(os.path.join(save_path, "crawler_state.pkl"), "wb") as f:
-        pickle.dump((list(fp_links), list(queue)), f)
-
-
 def load_state(save_path: str) -> tuple:
     try:
         with open(os.path.join(save_path, "crawler_state.pkl"), "rb") as f:
@@ -68,8 +62,11 @@ def save_dict_json(data, file_path):
         else:
             return obj
 
-    with open(file_path, "w", encoding="utf-8") as json_file:
+    # 先写临时文件再替换，常驻的索引管理器不会读到写了一半的文件
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as json_file:
         json.dump(convert_sets_to_lists(data), json_file, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, file_path)
 
 
 def load_dict_json(file_path):
@@ -131,18 +128,3 @@ def save_test_results(query, query_segs, scored_results, output_file='query_resu
 
     with open(output_file, 'w', encoding='utf-8') as file:
         json.dump(existing_data, file, ensure_ascii=False, indent=4)
-    
-def bonus(main_str, sub_str, target, radius):
-    sub_str_indices = [i for i in range(len(main_str)) if main_str.startswith(sub_str, i)]
-    target_pattern = re.compile(rf'(?<!{re.escape(target)}){re.escape(target)}(?!{re.escape(target)})')
-    
-    for index in sub_str_indices:
-        start = max(0, index - radius)
-        end = min(len(main_str), index + len(sub_str) + radius)
-        surrounding_text = main_str[start:end]
-        if target_pattern.search(surrounding_text):
-            return True
-    
-    return False
-
-